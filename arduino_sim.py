@@ -0,0 +1,174 @@
+import os
+import tty
+import time
+import heapq
+import random
+import select
+import logging
+import argparse
+import threading
+
+
+class ArduinoSimulator:
+    """
+    Simulated table Arduino on a local pseudo-terminal (Linux/macOS only).
+
+    Speaks the same protocol as the firmware: "a" homes the table and "5"
+    rotates it, each answered with one line. Tagged frames ("#<seq>:<cmd>\\n",
+    see serial_mux) are answered with "#<seq>:<reply>" and run concurrently;
+    plain commands are processed one after the other like the real sketch.
+    Point `serial.Serial(port=sim.port)` at it in place of the COM port.
+    """
+
+    replies = {
+        "a": "Homing finished",
+        "5": "Rotation finished",
+    }
+
+    def __init__(
+        self,
+        latency=0.5,
+        jitter=0.0,
+        drop_rate=0.0,
+        error_rate=0.0,
+        seed=None,
+    ):
+        # Latency may be one value for every command or a dict per command
+        self.latency = latency
+        self.jitter = jitter  # Standard deviation added to every latency
+        self.drop_rate = drop_rate  # Probability that a command is never answered
+        self.error_rate = error_rate  # Probability that a command is answered with "ERR"
+        self.rng = random.Random(seed)
+
+        self.stats = {"received": 0, "replied": 0, "dropped": 0, "errors": 0}
+
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+
+        self._lock = threading.Lock()
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        self._outbox = []  # Heap of (due time, order, reply bytes)
+        self._order = 0
+        self._busy_until = 0.0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name="arduino-sim", daemon=True
+        )
+        self._thread.start()
+        logging.info(f"Simulated Arduino listening on {self.port}")
+        return self
+
+    def stop(self):
+        self._running = False
+        os.write(self._wakeup_w, b"x")
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        for fd in (self._master, self._slave, self._wakeup_r, self._wakeup_w):
+            os.close(fd)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _command_latency(self, cmd):
+        if isinstance(self.latency, dict):
+            base = self.latency.get(cmd, 0.0)
+        else:
+            base = self.latency
+        if self.jitter:
+            base += self.rng.gauss(0.0, self.jitter)
+        return max(0.0, base)
+
+    def _handle_command(self, cmd, tag=None):
+        now = time.monotonic()
+        self.stats["received"] += 1
+
+        if self.rng.random() < self.drop_rate:
+            self.stats["dropped"] += 1
+            logging.debug(f"Simulator dropping {cmd!r}")
+            return
+
+        if self.rng.random() < self.error_rate:
+            self.stats["errors"] += 1
+            reply = "ERR"
+        else:
+            reply = self.replies.get(cmd, f"Unknown command {cmd}")
+
+        if tag is None:
+            # The sketch handles one plain command at a time
+            due = max(now, self._busy_until) + self._command_latency(cmd)
+            self._busy_until = due
+        else:
+            due = now + self._command_latency(cmd)
+            reply = f"#{tag}:{reply}"
+
+        with self._lock:
+            heapq.heappush(self._outbox, (due, self._order, (reply + "\r\n").encode()))
+            self._order += 1
+
+    def _run(self):
+        frame = b""
+        while self._running:
+            with self._lock:
+                next_due = self._outbox[0][0] if self._outbox else None
+
+            timeout = None if next_due is None else max(0.0, next_due - time.monotonic())
+            readable, _, _ = select.select([self._master, self._wakeup_r], [], [], timeout)
+
+            if self._master in readable:
+                for byte in os.read(self._master, 256):
+                    char = bytes([byte])
+                    if frame or char == b"#":
+                        # Tagged frame, terminated by a newline
+                        if char == b"\n":
+                            tag, _, cmd = frame[1:].decode().partition(":")
+                            self._handle_command(cmd.strip(), tag)
+                            frame = b""
+                        else:
+                            frame += char
+                    elif char not in (b"\r", b"\n"):
+                        self._handle_command(char.decode())
+
+            # Send every reply that is due
+            now = time.monotonic()
+            with self._lock:
+                while self._outbox and self._outbox[0][0] <= now:
+                    _, _, data = heapq.heappop(self._outbox)
+                    os.write(self._master, data)
+                    self.stats["replied"] += 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulated rotational table Arduino")
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    # Setup logging
+    logging.basicConfig(level=logging.INFO)
+
+    sim = ArduinoSimulator(
+        latency=args.latency,
+        jitter=args.jitter,
+        drop_rate=args.drop_rate,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    ).start()
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logging.info(f"Simulator stats: {sim.stats}")
+        sim.stop()
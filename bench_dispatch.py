@@ -0,0 +1,271 @@
+import gc
+import sys
+import json
+import time
+import logging
+import argparse
+import itertools
+import platform
+import tracemalloc
+import statistics
+
+
+class Variant:
+    """
+    One machine setup to benchmark: `setup()` returns (model, triggers, teardown).
+
+    The triggers are fired round-robin, so they must form a cycle that is
+    valid from the initial state.
+    """
+
+    def __init__(self, name, setup):
+        self.name = name
+        self.setup = setup
+
+
+def plain_gantry():
+    from gantry_state_machine import GantryStateMachine
+
+    gantry = GantryStateMachine()
+    gantry.trigger("event_1")
+    return gantry, ["event_2", "event_3", "event_4"], None
+
+
+def plain_traffic_light():
+    from traffic_light import TrafficLight
+
+    return TrafficLight(), ["timeup"], None
+
+
+def web_gantry():
+    from gantry_GUI import GantryStateMachine
+
+    gantry = GantryStateMachine()
+    gantry.trigger("event_1")
+    return gantry, ["event_2", "event_3", "event_4"], gantry.machine.stop_server
+
+
+def web_traffic_light():
+    from traffic_light_GUI import TrafficLightStateMachine
+
+    light = TrafficLightStateMachine()
+    return light, ["timeup"], light.machine.stop_server
+
+
+def manager_traffic_light():
+    from multiprocessing import Manager
+    from multiprocess import TrafficLightStateMachine
+
+    manager = Manager()
+    light = TrafficLightStateMachine(manager.Value("s", "green"))
+    return light, ["timeup"], manager.shutdown
+
+
+def shm_traffic_light():
+    from multiprocess import TrafficLightStateMachine
+    from shm_state import SharedStateSlot
+
+    slot = SharedStateSlot(states=TrafficLightStateMachine.states, create=True)
+    light = TrafficLightStateMachine(slot)
+
+    def teardown():
+        slot.close()
+        slot.unlink()
+
+    return light, ["timeup"], teardown
+
+
+class TableModel:
+    pass
+
+
+# Steady-state cycles of the rotational tables
+PUMP_CYCLE = ("BottleFull_BottleEmpty", ["Rotate", "Pump_to_measure_And_FillBottle", "Tray_to_pump"])
+MEASURE_CYCLE = (
+    "BottleM1_BottleM2_Bottle",
+    ["Rotate", "Measure_to_tray_And_UV_Measure_And_DLS_Measure", "Pump_to_measure"],
+)
+
+
+def plain_table(definition, cycle):
+    from transitions import Machine
+
+    initial, triggers = cycle
+    model = TableModel()
+    Machine(
+        model=model,
+        states=definition.states,
+        transitions=definition.transitions,
+        initial=initial,
+        ignore_invalid_triggers=True,
+        auto_transitions=False,
+    )
+    return model, triggers, None
+
+
+def compiled_table(definition, cycle):
+    from compiled_machine import CompiledMachine
+
+    initial, triggers = cycle
+    model = TableModel()
+    CompiledMachine(
+        model=model,
+        states=definition.states,
+        transitions=definition.transitions,
+        initial=initial,
+        ignore_invalid_triggers=True,
+    )
+    return model, triggers, None
+
+
+def plain_pump_table():
+    from rotational_table_pump import TablePumpStateMachine
+
+    return plain_table(TablePumpStateMachine, PUMP_CYCLE)
+
+
+def compiled_pump_table():
+    from rotational_table_pump import TablePumpStateMachine
+
+    return compiled_table(TablePumpStateMachine, PUMP_CYCLE)
+
+
+def plain_measure_table():
+    from rotational_table_measure import TableMeasureStateMachine
+
+    return plain_table(TableMeasureStateMachine, MEASURE_CYCLE)
+
+
+def compiled_measure_table():
+    from rotational_table_measure import TableMeasureStateMachine
+
+    return compiled_table(TableMeasureStateMachine, MEASURE_CYCLE)
+
+
+VARIANTS = [
+    Variant("machine_gantry", plain_gantry),
+    Variant("machine_traffic_light", plain_traffic_light),
+    Variant("webmachine_gantry", web_gantry),
+    Variant("webmachine_traffic_light", web_traffic_light),
+    Variant("manager_traffic_light", manager_traffic_light),
+    Variant("shm_traffic_light", shm_traffic_light),
+    Variant("machine_pump_table", plain_pump_table),
+    Variant("compiled_pump_table", compiled_pump_table),
+    Variant("machine_measure_table", plain_measure_table),
+    Variant("compiled_measure_table", compiled_measure_table),
+]
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def measure(model, triggers, iterations, warmup):
+    fire = model.trigger
+    # One running cycle across all passes keeps every trigger valid
+    next_trigger = itertools.cycle(triggers).__next__
+
+    for _ in range(warmup):
+        fire(next_trigger())
+
+    # Throughput and CPU time without per-trigger timing overhead
+    gc_before = gc.get_stats()[0]["collections"]
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for _ in range(iterations):
+        fire(next_trigger())
+    cpu_time = time.process_time() - cpu_start
+    wall_time = time.perf_counter() - wall_start
+    gc_collections = gc.get_stats()[0]["collections"] - gc_before
+
+    # Latency distribution, one sample per trigger
+    samples = []
+    clock = time.perf_counter_ns
+    for _ in range(iterations):
+        started = clock()
+        fire(next_trigger())
+        samples.append(clock() - started)
+    samples.sort()
+
+    # Allocations in a separate pass, tracemalloc slows everything down
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    for _ in range(iterations):
+        fire(next_trigger())
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "iterations": iterations,
+        "triggers_per_second": round(iterations / wall_time, 1),
+        "cpu_us_per_trigger": round(cpu_time / iterations * 1e6, 3),
+        "latency_us": {
+            "p50": round(percentile(samples, 0.50) / 1000, 3),
+            "p90": round(percentile(samples, 0.90) / 1000, 3),
+            "p99": round(percentile(samples, 0.99) / 1000, 3),
+            "max": round(samples[-1] / 1000, 3),
+            "mean": round(statistics.fmean(samples) / 1000, 3),
+        },
+        "peak_alloc_bytes": peak - baseline,
+        "retained_bytes": current - baseline,
+        "gc_gen0_collections": gc_collections,
+    }
+
+
+def run_variant(variant, iterations, warmup):
+    model, triggers, teardown = variant.setup()
+    try:
+        return measure(model, triggers, iterations, warmup)
+    finally:
+        if teardown:
+            teardown()
+
+
+if __name__ == "__main__":
+    names = [variant.name for variant in VARIANTS]
+
+    parser = argparse.ArgumentParser(description="Transition dispatch microbenchmark")
+    parser.add_argument("--variant", action="append", choices=names)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--warmup", type=int, default=1000)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    # Keep the machines' own logging off the hot path
+    logging.basicConfig(level=logging.WARNING)
+    logging.disable(logging.INFO)
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "iterations": args.iterations,
+        "variants": {},
+    }
+
+    for variant in VARIANTS:
+        if args.variant and variant.name not in args.variant:
+            continue
+        iterations = args.iterations
+        if variant.name.startswith("manager"):
+            # Every state access is a round trip to the Manager process
+            iterations = max(1, iterations // 20)
+        try:
+            results["variants"][variant.name] = run_variant(variant, iterations, args.warmup)
+        except ImportError as exc:
+            print(f"Skipping {variant.name}: {exc}", file=sys.stderr)
+            continue
+        metrics = results["variants"][variant.name]
+        print(
+            f"{variant.name:28s} {metrics['triggers_per_second']:>12,.0f} triggers/s  "
+            f"p50 {metrics['latency_us']['p50']:>8.2f} us  "
+            f"p99 {metrics['latency_us']['p99']:>8.2f} us",
+            file=sys.stderr,
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
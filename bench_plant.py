@@ -0,0 +1,180 @@
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import subprocess
+
+from simulation import LineSimulation, Normal, Uniform
+
+
+# Duration overrides per scenario, on top of simulation.DEFAULT_DURATIONS
+SCENARIOS = {
+    "baseline": {},
+    "fast_gantry": {
+        "gantry": {
+            "Tray_to_pump": Uniform(2.0, 3.0),
+            "Pump_to_measure": Uniform(2.0, 3.0),
+            "Measure_to_tray": Uniform(2.0, 3.0),
+        },
+    },
+    "fast_dls": {
+        "measure": {
+            "Pump_to_measure_And_UV_Measure_And_DLS_Measure": Normal(30.0, 3.0),
+            "Measure_to_tray_And_UV_Measure_And_DLS_Measure": Normal(30.0, 3.0),
+        },
+    },
+    "slow_pump": {
+        "pump": {
+            "FillBottle_And_Tray_to_pump": Normal(60.0, 5.0),
+            "Pump_to_measure_And_FillBottle": Normal(60.0, 5.0),
+        },
+    },
+}
+
+# Metrics where a lower value is a regression
+HIGHER_IS_BETTER = {"bottles_per_hour"}
+
+
+def station_report(station, elapsed):
+    waiting = sum(station.waiting.values())
+    return {
+        "dwell": {state: round(seconds, 3) for state, seconds in station.dwell.items()},
+        "busy": round(elapsed - waiting, 3),
+        "waiting_gantry": round(station.waiting["gantry"], 3),
+        "waiting_handoff": round(station.waiting["handoff"], 3),
+    }
+
+
+def run_scenario(name, hours, seed):
+    line = LineSimulation(durations=SCENARIOS[name], seed=seed)
+
+    started = time.perf_counter()
+    result = line.run(hours=hours)
+    wall_time = time.perf_counter() - started
+
+    elapsed = hours * 3600
+    gantry_waits = line.pump.waiting["gantry"] + line.measure.waiting["gantry"]
+    return {
+        "bottles": result["bottles"],
+        "bottles_per_hour": round(result["bottles_per_hour"], 3),
+        "gantry_utilisation": round(result["gantry_utilisation"], 4),
+        "gantry_jobs": line.gantry_jobs,
+        "gantry_mean_wait": round(gantry_waits / line.gantry_jobs, 3)
+        if line.gantry_jobs
+        else 0.0,
+        # The pump table is blocked by a full measure table, the measure table idles without bottles
+        "pump": station_report(line.pump, elapsed),
+        "measure": station_report(line.measure, elapsed),
+        "gantry": {
+            "dwell": {state: round(t, 3) for state, t in line.gantry.dwell.items()},
+        },
+        "wall_time": round(wall_time, 3),
+    }
+
+
+def run_realtime(duration, latency):
+    # Full PlantOrchestrator against the PTY Arduino simulator, without GUI servers
+    from arduino_sim import ArduinoSimulator
+    from microfluidic_SM import PlantOrchestrator
+
+    with ArduinoSimulator(latency=latency) as sim:
+        plant = PlantOrchestrator(pump_port=sim.port, gui="off")
+        try:
+            result = plant.run(duration=duration)
+        finally:
+            plant.stop_servers()
+
+    return {
+        "bottles": result["bottles"],
+        "bottles_per_hour": round(result["bottles_per_hour"], 3),
+        "gantry_utilisation": round(result["gantry"]["utilisation"], 4),
+        "gantry_mean_wait": round(result["gantry"]["mean_wait"], 3),
+        "gantry_max_depth": result["gantry"]["max_depth"],
+        "cycle_times": result["cycle_times"],
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """
+    Logs the change of every scenario's headline metrics against a previous
+    run and returns the names of the metrics that regressed beyond `tolerance`.
+    """
+    regressions = []
+    for name, metrics in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        for metric in ("bottles_per_hour", "gantry_utilisation", "gantry_mean_wait"):
+            if metric not in metrics or metric not in previous or not previous[metric]:
+                continue
+            change = (metrics[metric] - previous[metric]) / previous[metric]
+            logging.info(f"{name}.{metric}: {previous[metric]} -> {metrics[metric]} ({change:+.1%})")
+            if metric in HIGHER_IS_BETTER and change < -tolerance:
+                regressions.append(f"{name}.{metric}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plant throughput benchmark")
+    parser.add_argument("--hours", type=float, default=8.0, help="Simulated shift length")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS))
+    parser.add_argument(
+        "--realtime",
+        type=float,
+        metavar="SECONDS",
+        help="Also run the real orchestrator against the Arduino simulator",
+    )
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated Arduino latency")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.05)
+    args = parser.parse_args()
+
+    # Setup logging
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("transitions").setLevel(logging.WARNING)
+
+    results = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "hours": args.hours,
+        "seed": args.seed,
+        "scenarios": {},
+    }
+
+    for name in args.scenario or SCENARIOS:
+        results["scenarios"][name] = run_scenario(name, args.hours, args.seed)
+        metrics = results["scenarios"][name]
+        logging.info(
+            f"{name}: {metrics['bottles_per_hour']} bottles/hour, "
+            f"gantry utilisation {metrics['gantry_utilisation']:.1%}"
+        )
+
+    if args.realtime:
+        results["scenarios"]["realtime"] = run_realtime(args.realtime, args.latency)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        logging.info(f"Results written to {args.output}")
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            logging.error(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
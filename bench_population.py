@@ -0,0 +1,113 @@
+import gc
+import sys
+import json
+import time
+import logging
+import argparse
+import tracemalloc
+from multiprocessing import Process, Queue
+
+from car import Vehicle, VehicleBase
+from shared_machine import SharedMachine
+
+
+def own_machines(count):
+    return [Vehicle() for _ in range(count)]
+
+
+def shared_machine(count):
+    # A fresh class and machine per call instead of car.VEHICLES, which would
+    # keep the vehicles of every earlier call alive
+    model_class = type("BenchVehicle", (VehicleBase,), {"__slots__": ("state",)})
+    machine = SharedMachine(
+        model_class, states=VehicleBase.states, transitions=VehicleBase.transitions, initial="stop"
+    )
+    return machine.create(count)
+
+
+POPULATIONS = {
+    "machine_per_vehicle": own_machines,
+    "shared_machine": shared_machine,
+}
+
+
+def measure(create, count):
+    """
+    Creation time and memory per vehicle, and the time of a green/red round
+    over the whole population.
+    """
+    gc.collect()
+    started = time.perf_counter()
+    vehicles = create(count)
+    creation_time = time.perf_counter() - started
+    del vehicles
+
+    # Memory in a separate pass, tracemalloc slows the creation down
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    vehicles = create(count)
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for light in ("green", "red"):
+        for vehicle in vehicles:
+            vehicle.handle_traffic_light(light)
+    round_time = time.perf_counter() - started
+
+    return {
+        "vehicles": count,
+        "creation_us_per_vehicle": round(creation_time / count * 1e6, 3),
+        "bytes_per_vehicle": round((current - baseline) / count, 1),
+        "triggers_per_second": round(2 * count / round_time, 1),
+    }
+
+
+def _measure_population(name, count, results):
+    logging.disable(logging.INFO)
+    results.put(measure(POPULATIONS[name], count))
+
+
+def measure_in_process(name, count):
+    """
+    measure() in a process of its own, so no population is measured on the
+    heap (or with the models) another one left behind.
+    """
+    results = Queue()
+    process = Process(target=_measure_population, args=(name, count, results))
+    process.start()
+    metrics = results.get()
+    process.join()
+    return metrics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory and creation time of large Vehicle populations")
+    parser.add_argument("--vehicles", type=int, default=20000)
+    parser.add_argument("--population", action="append", choices=sorted(POPULATIONS))
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    # Keep the machines' own logging off the hot path
+    logging.basicConfig(level=logging.WARNING)
+    logging.disable(logging.INFO)
+
+    results = {"populations": {}}
+    for name in POPULATIONS:
+        if args.population and name not in args.population:
+            continue
+        metrics = results["populations"][name] = measure_in_process(name, args.vehicles)
+        print(
+            f"{name:22s} {metrics['bytes_per_vehicle']:>10,.0f} B/vehicle  "
+            f"{metrics['creation_us_per_vehicle']:>8.2f} us to create  "
+            f"{metrics['triggers_per_second']:>10,.0f} triggers/s",
+            file=sys.stderr,
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
@@ -1,17 +1,18 @@
-import time
 from transitions import Machine
-from multiprocessing import shared_memory
 
+from shm_state import SharedStateSlot
+from shared_machine import SharedMachine
 
-class Vehicle:
-    states = ["stop", "moving"]
 
-    def __init__(self):
-        # Initialize the state machine for the vehicle
-        self.machine = Machine(model=self, states=Vehicle.states, initial="stop")
+class VehicleBase:
+    # Vehicle behaviour shared by the per-instance and the shared-machine models
+    __slots__ = ()
 
-        self.machine.add_transition("start_engine", "stop", "moving")
-        self.machine.add_transition("brake", "moving", "stop")
+    states = ["stop", "moving"]
+    transitions = [
+        {"trigger": "start_engine", "source": "stop", "dest": "moving"},
+        {"trigger": "brake", "source": "moving", "dest": "stop"},
+    ]
 
     def handle_traffic_light(self, traffic_light_state):
         # This is the switcher pattern integrated into the vehicle class
@@ -38,25 +39,41 @@ class Vehicle:
         return "Car is waiting..."
 
 
+class Vehicle(VehicleBase):
+    def __init__(self):
+        # Initialize the state machine for the vehicle
+        self.machine = Machine(
+            model=self, states=Vehicle.states, transitions=Vehicle.transitions, initial="stop"
+        )
+
+
+class SlotVehicle(VehicleBase):
+    """
+    Vehicle for large populations: create them through VEHICLES.create(n),
+    they all share one machine and only carry their state. VEHICLES keeps
+    them alive until they are handed to VEHICLES.remove_model().
+    """
+
+    __slots__ = ("state",)
+
+
+VEHICLES = SharedMachine(
+    SlotVehicle, states=VehicleBase.states, transitions=VehicleBase.transitions, initial="stop"
+)
+
+
 if __name__ == "__main__":
     car = Vehicle()
 
-    # Connect to the existing shared memory block using the known name
-    shm_name = "my_custom_shm"
-    existing_shm = shared_memory.SharedMemory(name=shm_name)
-
-    # Define the size based on the longest possible traffic light state (green, yellow, red)
-    data_size = 6  # "yellow" is the longest state with 6 characters
+    # Connect to the traffic light's state slot using the known name
+    existing_shm = SharedStateSlot("my_custom_shm")
+    subscription = existing_shm.subscribe()
+    seq = None
 
     try:
         while True:
-            time.sleep(1)
-
-            # Read the byte data from shared memory
-            data_bytes = bytes(existing_shm.buf[:data_size])
-
-            # Convert the bytes back into a string and remove null bytes
-            data = data_bytes.decode("utf-8").rstrip("\x00")
+            # Sleep until the traffic light actually changes
+            seq, data, _ = subscription.wait(seq)
             print(f"Now is {data}")
 
             # Transition based on the traffic light state
@@ -70,4 +87,5 @@ if __name__ == "__main__":
 
     finally:
         # Clean up shared memory
+        subscription.close()
         existing_shm.close()
@@ -1,8 +1,7 @@
-import time
 import logging
 
-from transitions_gui import WebMachine
-from multiprocessing import shared_memory
+from utils import make_machine, stop_gui
+from shm_state import SharedStateSlot
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -11,9 +10,9 @@ logging.basicConfig(level=logging.INFO)
 class Vehicle:
     states = ["stop", "moving"]
 
-    def __init__(self):
+    def __init__(self, gui=None):
         # Initialize the state machine
-        self.machine = WebMachine(
+        self.machine = make_machine(
             model=self,
             states=Vehicle.states,
             initial="stop",
@@ -21,6 +20,7 @@ class Vehicle:
             ignore_invalid_triggers=True,
             auto_transitions=False,
             port=8084,
+            gui=gui,
         )
 
         self.machine.add_transition("start_engine", "stop", "moving")
@@ -54,22 +54,15 @@ class Vehicle:
 if __name__ == "__main__":
     car = Vehicle()
 
-    # Connect to the existing shared memory block using the known name
-    shm_name = "my_custom_shm"
-    existing_shm = shared_memory.SharedMemory(name=shm_name)
-
-    # Define the size based on the longest possible traffic light state (green, yellow, red)
-    data_size = 6  # "yellow" is the longest state with 6 characters
+    # Connect to the traffic light's state slot using the known name
+    existing_shm = SharedStateSlot("my_custom_shm")
+    subscription = existing_shm.subscribe()
+    seq = None
 
     try:
         while True:
-            time.sleep(1)
-
-            # Read the byte data from shared memory
-            data_bytes = bytes(existing_shm.buf[:data_size])
-
-            # Convert the bytes back into a string and remove null bytes
-            data = data_bytes.decode("utf-8").rstrip("\x00")
+            # Sleep until the traffic light actually changes
+            seq, data, _ = subscription.wait(seq)
             logging.info(f"Now is {data}")
 
             # Transition based on the traffic light state
@@ -79,8 +72,9 @@ if __name__ == "__main__":
                 logging.info(action_result)
 
     except KeyboardInterrupt:
-        car.machine.stop_server()
+        stop_gui(car.machine)
 
     finally:
         # Clean up shared memory
+        subscription.close()
         existing_shm.close()
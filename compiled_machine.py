@@ -0,0 +1,194 @@
+from transitions import MachineError
+
+
+class CompiledMachine:
+    """
+    Fixed state machine lowered to a dense state x trigger integer table.
+
+    Meant for deterministic definitions like the rotational tables' cycles:
+    states and triggers are numbered once, every (state, trigger) cell holds
+    the destination index (or -1) and the callbacks of that transition are
+    resolved to bound methods up front. Firing a trigger is then a dict lookup,
+    a list index and a few calls instead of transitions' generic event
+    resolution.
+
+    The model keeps the familiar API: `model.state`, `model.trigger(name)`,
+    one method per trigger (unless the model defines its own) and
+    `model.is_<state>()`. Supported transition keys are trigger, source
+    (a name, a list or "*"), dest, before and after; states may be names or
+    dicts with name/on_enter/on_exit, and the model's on_enter_<state> /
+    on_exit_<state> methods are picked up like in transitions. Conditions are
+    not supported, they would make the table non-deterministic.
+    """
+
+    def __init__(
+        self,
+        model,
+        states,
+        transitions,
+        initial,
+        name=None,
+        ignore_invalid_triggers=False,
+        before_state_change=None,
+        after_state_change=None,
+    ):
+        self.model = model
+        self.name = name
+        self.ignore_invalid_triggers = ignore_invalid_triggers
+
+        # Machine-level callbacks stay lists, so hooks may be added at runtime
+        self.before_state_change = self._listify(before_state_change)
+        self.after_state_change = self._listify(after_state_change)
+
+        state_defs = [state if isinstance(state, dict) else {"name": state} for state in states]
+        self.states = [state["name"] for state in state_defs]
+        self.state_index = {name: i for i, name in enumerate(self.states)}
+
+        self.triggers = []
+        self.trigger_index = {}
+        for transition in transitions:
+            transition = self._as_dict(transition)
+            if transition["trigger"] not in self.trigger_index:
+                self.trigger_index[transition["trigger"]] = len(self.triggers)
+                self.triggers.append(transition["trigger"])
+
+        n_triggers = len(self.triggers)
+        self._n_triggers = n_triggers
+        self.table = [-1] * (len(self.states) * n_triggers)
+        self._before = [()] * len(self.table)
+        self._after = [()] * len(self.table)
+
+        on_enter = [self._state_callbacks(state, "enter") for state in state_defs]
+        on_exit = [self._state_callbacks(state, "exit") for state in state_defs]
+
+        for transition in transitions:
+            transition = self._as_dict(transition)
+            unsupported = set(transition) - {"trigger", "source", "dest", "before", "after"}
+            if unsupported:
+                raise ValueError(
+                    f"CompiledMachine does not support {sorted(unsupported)} "
+                    f"(trigger {transition['trigger']!r})"
+                )
+
+            sources = transition["source"]
+            if sources == "*":
+                sources = self.states
+            elif not isinstance(sources, (list, tuple)):
+                sources = [sources]
+
+            t = self.trigger_index[transition["trigger"]]
+            for source in sources:
+                s = self.state_index[source]
+                cell = s * n_triggers + t
+                if self.table[cell] >= 0:
+                    # transitions would take the first matching transition as well
+                    continue
+                before = self._resolve(transition.get("before"))
+                after = self._resolve(transition.get("after"))
+                if transition["dest"] is None:
+                    # Internal transition: no exit/enter callbacks
+                    self.table[cell] = s
+                else:
+                    dest = self.state_index[transition["dest"]]
+                    self.table[cell] = dest
+                    before += on_exit[s]
+                    after = on_enter[dest] + after
+                self._before[cell] = tuple(before)
+                self._after[cell] = tuple(after)
+
+        self._current = self.state_index[initial]
+        model.state = initial
+
+        # Bind the model API
+        model.trigger = self.trigger
+        for trigger in self.triggers:
+            if not hasattr(model, trigger):
+                setattr(model, trigger, self._trigger_method(trigger))
+        for state in self.states:
+            if not hasattr(model, "is_" + state):
+                setattr(model, "is_" + state, self._is_state_method(state))
+
+    @staticmethod
+    def _listify(callbacks):
+        if callbacks is None:
+            return []
+        return list(callbacks) if isinstance(callbacks, (list, tuple)) else [callbacks]
+
+    @staticmethod
+    def _as_dict(transition):
+        if isinstance(transition, dict):
+            return transition
+        # List form: [trigger, source, dest]
+        return dict(zip(("trigger", "source", "dest"), transition))
+
+    def _resolve(self, callbacks):
+        resolved = []
+        for callback in self._listify(callbacks):
+            resolved.append(getattr(self.model, callback) if isinstance(callback, str) else callback)
+        return resolved
+
+    def _state_callbacks(self, state, kind):
+        callbacks = self._resolve(state.get("on_" + kind))
+        method = getattr(self.model, f"on_{kind}_{state['name']}", None)
+        if method is not None:
+            callbacks.append(method)
+        return callbacks
+
+    def _trigger_method(self, trigger):
+        def fire(*args, **kwargs):
+            return self.trigger(trigger, *args, **kwargs)
+
+        return fire
+
+    def _is_state_method(self, state):
+        index = self.state_index[state]
+        return lambda: self._current == index
+
+    def trigger(self, trigger, *args, **kwargs):
+        t = self.trigger_index.get(trigger)
+        if t is None:
+            raise AttributeError(f"Do not know event named '{trigger}'.")
+
+        cell = self._current * self._n_triggers + t
+        dest = self.table[cell]
+        if dest < 0:
+            if self.ignore_invalid_triggers:
+                return False
+            raise MachineError(
+                f"Can't trigger event {trigger} from state {self.states[self._current]}!"
+            )
+
+        for callback in self.before_state_change:
+            self._call(callback, args, kwargs)
+        for callback in self._before[cell]:
+            callback(*args, **kwargs)
+
+        self._current = dest
+        self.model.state = self.states[dest]
+
+        for callback in self._after[cell]:
+            callback(*args, **kwargs)
+        for callback in self.after_state_change:
+            self._call(callback, args, kwargs)
+        return True
+
+    def add_transition_callback(self, trigger, kind, callback):
+        # Like transitions' Transition.add_callback, for every transition of `trigger`
+        if kind not in ("before", "after"):
+            raise ValueError(f"Unknown transition callback kind {kind!r}")
+        callbacks = self._before if kind == "before" else self._after
+        t = self.trigger_index[trigger]
+        for s in range(len(self.states)):
+            cell = s * self._n_triggers + t
+            if self.table[cell] >= 0:
+                callbacks[cell] += (self._resolve(callback)[0],)
+
+    def _call(self, callback, args, kwargs):
+        if isinstance(callback, str):
+            callback = getattr(self.model, callback)
+        callback(*args, **kwargs)
+
+    def set_state(self, state):
+        # Jump to a state without running callbacks (e.g. when restoring)
+        self._current = self.state_index[state]
+        self.model.state = state
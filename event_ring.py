@@ -0,0 +1,249 @@
+import sys
+import time
+import struct
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+MAGIC = b"SMEV"
+VERSION = 1
+
+# magic, version, capacity | head (number of records ever written) | records
+HEADER = struct.Struct("<4sHxxI")
+HEAD = struct.Struct("<Q")
+HEAD_OFFSET = 16
+RECORDS_OFFSET = 64
+
+# Every record starts with a stamp (its sequence number + 1, 0 while it is
+# being written) followed by timestamp, machine id, trigger, source and dest
+NAME_SIZE = 64
+STAMP = struct.Struct("<Q")
+BODY = struct.Struct(f"<dI4x{NAME_SIZE}s{NAME_SIZE}s{NAME_SIZE}s")
+RECORD_SIZE = STAMP.size + BODY.size
+
+TransitionEvent = namedtuple(
+    "TransitionEvent", ["seq", "timestamp", "machine_id", "trigger", "source", "dest"]
+)
+
+
+def _encode(name):
+    encoded = name.encode("utf-8")
+    if len(encoded) > NAME_SIZE:
+        raise ValueError(f"{name!r} is longer than {NAME_SIZE} bytes")
+    return encoded
+
+
+class EventRing:
+    """
+    Transition events in a shared-memory ring buffer, one producer, any number
+    of consumers.
+
+    The producer appends fixed-size records and never waits for anyone: once
+    the ring is full the oldest record is overwritten. Consumers never write
+    to the segment, each one keeps its own cursor in a RingReader, so a slow
+    consumer does not hold back the producer or the other consumers. Each
+    record carries its own stamp, which lets a reader detect that the producer
+    lapped it, skip to the oldest record that is still intact and report how
+    many events it lost.
+    """
+
+    def __init__(self, name=None, capacity=4096, create=False):
+        if create:
+            self.shm = shared_memory.SharedMemory(
+                name=name, create=True, size=RECORDS_OFFSET + capacity * RECORD_SIZE
+            )
+            HEADER.pack_into(self.shm.buf, 0, MAGIC, VERSION, capacity)
+            HEAD.pack_into(self.shm.buf, HEAD_OFFSET, 0)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        magic, version, self.capacity = HEADER.unpack_from(self.shm.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{name} is not a version {VERSION} event ring")
+
+        self.name = self.shm.name
+        self.created = create
+
+    def __reduce__(self):
+        # Other processes attach by name
+        return (EventRing, (self.name, None, False))
+
+    def head(self):
+        return HEAD.unpack_from(self.shm.buf, HEAD_OFFSET)[0]
+
+    def _offset(self, seq):
+        return RECORDS_OFFSET + (seq % self.capacity) * RECORD_SIZE
+
+    def append(self, machine_id, trigger, source, dest, timestamp=None):
+        self._append(machine_id, _encode(trigger), _encode(source), _encode(dest), timestamp)
+
+    def _append(self, machine_id, trigger, source, dest, timestamp=None):
+        buf = self.shm.buf
+        seq = HEAD.unpack_from(buf, HEAD_OFFSET)[0]
+        offset = self._offset(seq)
+        STAMP.pack_into(buf, offset, 0)  # Readers of the old record see it is gone
+        BODY.pack_into(
+            buf,
+            offset + STAMP.size,
+            time.time() if timestamp is None else timestamp,
+            machine_id,
+            trigger,
+            source,
+            dest,
+        )
+        STAMP.pack_into(buf, offset, seq + 1)
+        HEAD.pack_into(buf, HEAD_OFFSET, seq + 1)
+
+    def attach(self, machine, machine_id=0):
+        """
+        Appends a record for every transition `machine` performs.
+
+        A machine-level after_state_change callback is not told which trigger
+        fired or where the model came from, so the record is appended from an
+        `after` callback added to each transition instead; it runs right
+        before the machine's after_state_change callbacks. Transitions added
+        to the machine later are not recorded.
+        """
+        for event in machine.events.values():
+            trigger = _encode(event.name)
+            for transitions in event.transitions.values():
+                for transition in transitions:
+                    source = _encode(transition.source)
+                    # Internal transitions (dest None) stay in their source state
+                    dest = source if transition.dest is None else _encode(transition.dest)
+                    transition.add_callback(
+                        "after", RingRecorder(self, machine_id, trigger, source, dest)
+                    )
+
+    def reader(self, start="latest"):
+        return RingReader(self, start)
+
+    def close(self):
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+class RingRecorder:
+    """
+    Transition callback appending one transition's record to an EventRing.
+
+    A class rather than a closure so machines with recorders attached can
+    still be pickled, e.g. to hand them to a spawned Process; the ring
+    travels by name and is reattached on the other side.
+    """
+
+    def __init__(self, ring, machine_id, trigger, source, dest):
+        self.ring = ring
+        self.machine_id = machine_id
+        self.trigger = trigger
+        self.source = source
+        self.dest = dest
+
+    def __call__(self, *args, **kwargs):
+        self.ring._append(self.machine_id, self.trigger, self.source, self.dest)
+
+    def __reduce__(self):
+        return (
+            RingRecorder,
+            (self.ring, self.machine_id, self.trigger, self.source, self.dest),
+        )
+
+
+class RingReader:
+    """
+    One consumer's cursor into an EventRing.
+
+    start="latest" only returns events appended from now on, start="oldest"
+    also returns whatever the ring still holds.
+    """
+
+    def __init__(self, ring, start="latest"):
+        self.ring = ring
+        head = ring.head()
+        self.cursor = head if start == "latest" else max(0, head - ring.capacity)
+        self.lost = 0  # Events overwritten before this reader got to them
+        self._names = {}
+
+    def lag(self):
+        # Events appended but not read yet
+        return self.ring.head() - self.cursor
+
+    def _decode(self, name):
+        decoded = self._names.get(name)
+        if decoded is None:
+            decoded = self._names[name] = name.rstrip(b"\0").decode("utf-8")
+        return decoded
+
+    def read(self, max_events=None):
+        """
+        Returns (events, lost): the TransitionEvents since the last read, at
+        most `max_events` of them, and how many events were overwritten before
+        they could be read. A non-zero `lost` means this reader fell behind by
+        more than the ring's capacity.
+        """
+        ring = self.ring
+        buf = ring.shm.buf
+        head = ring.head()
+        lost = 0
+
+        oldest = head - ring.capacity
+        if self.cursor < oldest:
+            lost += oldest - self.cursor
+            self.cursor = oldest
+
+        end = head if max_events is None else min(head, self.cursor + max_events)
+        events = []
+        while self.cursor < end:
+            seq = self.cursor
+            offset = ring._offset(seq)
+            stamp = STAMP.unpack_from(buf, offset)[0]
+            timestamp, machine_id, trigger, source, dest = BODY.unpack_from(
+                buf, offset + STAMP.size
+            )
+            if stamp == seq + 1 and STAMP.unpack_from(buf, offset)[0] == stamp:
+                events.append(
+                    TransitionEvent(
+                        seq,
+                        timestamp,
+                        machine_id,
+                        self._decode(trigger),
+                        self._decode(source),
+                        self._decode(dest),
+                    )
+                )
+                self.cursor += 1
+                continue
+
+            # The producer lapped us while copying: skip past the slot it is rewriting
+            oldest = ring.head() - ring.capacity + 1
+            lost += oldest - seq
+            self.cursor = oldest
+            end = max(end, oldest)
+
+        self.lost += lost
+        return events, lost
+
+
+if __name__ == "__main__":
+    # Print the events of a running producer, e.g. `python event_ring.py my_custom_events`
+    ring = EventRing(sys.argv[1] if len(sys.argv) > 1 else "my_custom_events")
+    reader = ring.reader(start="oldest")
+
+    try:
+        while True:
+            events, lost = reader.read()
+            if lost:
+                print(f"Fell behind, {lost} events lost")
+            for event in events:
+                print(
+                    f"#{event.seq} machine {event.machine_id}: "
+                    f"{event.source} --{event.trigger}--> {event.dest}"
+                )
+            time.sleep(1)
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        ring.close()
@@ -1,6 +1,9 @@
 import time
 import logging
-from transitions_gui import WebMachine
+
+from gantry_queue import GantryJobQueue
+from metrics import instrument
+from utils import make_machine, stop_gui
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -9,9 +12,17 @@ logging.basicConfig(level=logging.INFO)
 class GantryStateMachine:
     states = ["Idle", "Tray_to_pump", "Pump_to_measure", "Measure_to_tray"]
     transitions = [
-        {"trigger": "getRequest1", "source": "Idle", "dest": "Tray_to_pump"},
-        {"trigger": "getRequest2", "source": "Idle", "dest": "Measure_to_tray"},
-        {"trigger": "getRequest3", "source": "Idle", "dest": "Pump_to_measure"},
+        {"trigger": "getRequest_Tray_to_pump", "source": "Idle", "dest": "Tray_to_pump"},
+        {
+            "trigger": "getRequest_Measure_to_tray",
+            "source": "Idle",
+            "dest": "Measure_to_tray",
+        },
+        {
+            "trigger": "getRequest_Pump_to_measure",
+            "source": "Idle",
+            "dest": "Pump_to_measure",
+        },
         {
             "trigger": "finishRequest",
             "source": ["Tray_to_pump", "Measure_to_tray", "Pump_to_measure"],
@@ -19,9 +30,16 @@ class GantryStateMachine:
         },
     ]
 
-    def __init__(self):
+    # Pick-up and drop-off station of every job
+    routes = {
+        "Tray_to_pump": ("tray", "pump"),
+        "Pump_to_measure": ("pump", "measure"),
+        "Measure_to_tray": ("measure", "tray"),
+    }
+
+    def __init__(self, gui_port=8083, move_durations=None, gui=None):
         # Initialize the state machine
-        self.machine = WebMachine(
+        self.machine = make_machine(
             model=self,
             states=GantryStateMachine.states,
             transitions=GantryStateMachine.transitions,
@@ -29,9 +47,17 @@ class GantryStateMachine:
             name="Gantry",
             ignore_invalid_triggers=True,
             auto_transitions=False,
-            port=8083,
+            port=gui_port,
+            gui=gui,
         )
 
+        # Simulated travel time of every job in seconds
+        self.move_durations = move_durations or {job: 1.0 for job in self.routes}
+        self.position = "tray"
+
+        # Per-trigger latency and per-state dwell histograms (see metrics)
+        self.metrics = instrument(self)
+
     # Transition methods for triggering events
     def stop(self):
         logging.info("Gantry stopping...")
@@ -39,42 +65,43 @@ class GantryStateMachine:
     def getRequest_Tray_to_pump(self):
         logging.info("Processing request 1, transitioning from Idle to Tray_to_pump")
         self.trigger("getRequest_Tray_to_pump")
-        # Simulate finishing the request
-        time.sleep(1)  # Simulate some processing time
-        self.finishRequest()
 
     def getRequest_Measure_to_tray(self):
         logging.info("Processing request 2, transitioning from Idle to Measure_to_tray")
         self.trigger("getRequest_Measure_to_tray")
-        # Simulate finishing the request
-        time.sleep(1)  # Simulate some processing time
-        self.finishRequest()
 
     def getRequest_Pump_to_measure(self):
         logging.info("Processing request 3, transitioning from Idle to Pump_to_measure")
         self.trigger("getRequest_Pump_to_measure")
-        # Simulate finishing the request
-        time.sleep(1)  # Simulate some processing time
-        self.finishRequest()
 
     def finishRequest(self):
         # Automatically return to idle state after a request is finished
         logging.info("Gantry: Returning to Idle state automatically")
-        time.sleep(1)  # Optional delay before returning to Idle
         self.trigger("finishRequest")
         logging.info(f"Gantry state after auto return: {self.state}")
 
+    def run_job(self, job):
+        """
+        Carries out one job from start to finish; blocks for the travel time.
+
+        Callers that must not block submit jobs to a GantryJobQueue instead.
+        """
+        getattr(self, "getRequest_" + job)()
+        time.sleep(self.move_durations[job])  # Simulate the move
+        self.position = self.routes[job][1]
+        self.finishRequest()
+
 
 if __name__ == "__main__":
-    # Create the gantry state machine
+    # Create the gantry state machine and its job queue
     gantry = GantryStateMachine()
+    jobs = GantryJobQueue(gantry).start()
 
-    # Mapping user inputs to the respective state machine actions
+    # Mapping user inputs to the respective gantry jobs
     actions = {
-        0: gantry.stop,
-        1: gantry.getRequest_Tray_to_pump,
-        2: gantry.getRequest_Measure_to_tray,
-        3: gantry.getRequest_Pump_to_measure,
+        1: "Tray_to_pump",
+        2: "Measure_to_tray",
+        3: "Pump_to_measure",
     }
 
     try:
@@ -86,13 +113,16 @@ if __name__ == "__main__":
                 )
             )
 
-            # Trigger the corresponding action
-            if next_action in actions:
-                actions[next_action]()  # Call the appropriate method based on input
-                logging.info(f"Gantry state: {gantry.state}")
+            # Queue the corresponding job without waiting for the gantry
+            if next_action == 0:
+                gantry.stop()
+            elif next_action in actions:
+                jobs.submit(actions[next_action])
+                logging.info(f"Gantry queue: {jobs.stats()}")
             else:
                 logging.error("Invalid input! Please select a valid command.")
 
     except KeyboardInterrupt:  # Ctrl + C to stop the server
         logging.info("Stopping the server...")
-        gantry.machine.stop_server()
+        jobs.stop()
+        stop_gui(gantry.machine)
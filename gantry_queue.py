@@ -0,0 +1,137 @@
+import time
+import logging
+import itertools
+import threading
+from concurrent.futures import Future
+
+
+class GantryJob:
+    def __init__(self, name, priority, seq):
+        self.name = name
+        self.priority = priority
+        self.seq = seq
+        self.future = Future()
+        self.submitted = time.monotonic()
+
+
+class GantryJobQueue:
+    """
+    Non-blocking job queue in front of a GantryStateMachine.
+
+    Callers submit Tray_to_pump / Pump_to_measure / Measure_to_tray jobs and
+    get a Future back. A worker thread runs one job at a time, picking the
+    highest priority first and, among equal priorities, the job whose pick-up
+    station is closest to where the gantry currently is. Waiting jobs gain one
+    priority level every 1 / `aging` seconds so a far-away job is never starved.
+    """
+
+    # Station coordinates along the gantry axis
+    positions = {"tray": 0.0, "pump": 1.0, "measure": 2.0}
+
+    def __init__(self, gantry, aging=0.1, positions=None):
+        self.gantry = gantry
+        self.aging = aging
+        self.positions = positions or GantryJobQueue.positions
+
+        self._jobs = []
+        self._seq = itertools.count()
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+        self.served = 0
+        self.max_depth = 0
+        self.busy_time = 0.0
+        self.wait_times = {}  # Job name -> list of waits in seconds
+        self._started = None
+
+    def start(self):
+        self._running = True
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="gantry-queue", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+        # Nothing will run the jobs that are still queued
+        for job in self._jobs:
+            job.future.cancel()
+        self._jobs.clear()
+
+    def submit(self, name, priority=0):
+        if name not in self.gantry.routes:
+            raise ValueError(f"Unknown gantry job: {name}")
+
+        job = GantryJob(name, priority, next(self._seq))
+        with self._condition:
+            if not self._running:
+                # Queue is stopped, the job would never run
+                job.future.cancel()
+                return job.future
+            self._jobs.append(job)
+            self.max_depth = max(self.max_depth, len(self._jobs))
+            self._condition.notify()
+        return job.future
+
+    def depth(self):
+        return len(self._jobs)
+
+    def travel(self, name):
+        pickup = self.gantry.routes[name][0]
+        return abs(self.positions[pickup] - self.positions[self.gantry.position])
+
+    def _next_job(self):
+        now = time.monotonic()
+        return min(
+            self._jobs,
+            key=lambda job: (
+                -(job.priority + int(self.aging * (now - job.submitted))),
+                self.travel(job.name),
+                job.seq,
+            ),
+        )
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and not self._jobs:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                job = self._next_job()
+                self._jobs.remove(job)
+
+            if not job.future.set_running_or_notify_cancel():
+                continue
+
+            started = time.monotonic()
+            self.wait_times.setdefault(job.name, []).append(started - job.submitted)
+            try:
+                self.gantry.run_job(job.name)
+            except Exception as exc:
+                logging.exception(f"Gantry job {job.name} failed")
+                job.future.set_exception(exc)
+            else:
+                job.future.set_result(job.name)
+            finally:
+                self.busy_time += time.monotonic() - started
+                self.served += 1
+
+    def stats(self):
+        waits = [wait for waits in self.wait_times.values() for wait in waits]
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        return {
+            "depth": self.depth(),
+            "max_depth": self.max_depth,
+            "served": self.served,
+            "mean_wait": sum(waits) / len(waits) if waits else 0.0,
+            "max_wait": max(waits, default=0.0),
+            "utilisation": self.busy_time / elapsed if elapsed > 0 else 0.0,
+        }
@@ -0,0 +1,260 @@
+import os
+import json
+import html
+import math
+import hashlib
+import logging
+import tempfile
+from collections import OrderedDict
+
+# Bump when the drawing changes, so cached graphs are redrawn
+LAYOUT_VERSION = 1
+
+NODE_RX, NODE_RY = 70.0, 22.0
+LAYER_GAP = 110.0
+NODE_GAP = 170.0
+MARGIN = 60.0
+
+
+def definition(markup):
+    """
+    The parts of a machine's markup that decide its drawing: state names and
+    (source, dest, trigger) triples, not its models or current state.
+    """
+    states = [state["name"] if isinstance(state, dict) else state for state in markup["states"]]
+    transitions = [
+        (t["source"], t.get("dest") or t["source"], t["trigger"])
+        for t in markup.get("transitions", [])
+    ]
+    return {"initial": markup.get("initial"), "states": states, "transitions": transitions}
+
+
+def definition_key(markup):
+    data = json.dumps([LAYOUT_VERSION, definition(markup)], sort_keys=True)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def layered_layout(states, edges, initial=None, sweeps=8):
+    """
+    Places states in layers along the machine's flow, Sugiyama style.
+
+    Edges that close a cycle (found by a depth-first search from the initial
+    state) are ignored for layering, every state goes one layer below its
+    deepest predecessor, and the order inside each layer is improved by a few
+    barycenter sweeps to reduce crossings. Returns {state: (x, y)}.
+    """
+    successors = {state: [] for state in states}
+    for source, dest in edges:
+        if source != dest and dest not in successors[source]:
+            successors[source].append(dest)
+
+    # Depth-first search for the back edges, starting with the initial state
+    back_edges = set()
+    visited, on_stack = set(), set()
+    roots = ([initial] if initial in successors else []) + states
+    for root in roots:
+        if root in visited:
+            continue
+        stack = [(root, iter(successors[root]))]
+        visited.add(root)
+        on_stack.add(root)
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                on_stack.discard(node)
+            elif child in on_stack:
+                back_edges.add((node, child))
+            elif child not in visited:
+                visited.add(child)
+                on_stack.add(child)
+                stack.append((child, iter(successors[child])))
+
+    forward = [(s, d) for s in states for d in successors[s] if (s, d) not in back_edges]
+    predecessors = {state: [] for state in states}
+    for source, dest in forward:
+        predecessors[dest].append(source)
+
+    # Longest path layering in topological order
+    layer = {}
+    indegree = {state: len(predecessors[state]) for state in states}
+    ready = [state for state in states if indegree[state] == 0]
+    while ready:
+        state = ready.pop(0)
+        layer[state] = max((layer[p] + 1 for p in predecessors[state]), default=0)
+        for dest in successors[state]:
+            if (state, dest) in back_edges:
+                continue
+            indegree[dest] -= 1
+            if indegree[dest] == 0:
+                ready.append(dest)
+
+    layers = [[] for _ in range(max(layer.values(), default=0) + 1)]
+    for state in states:
+        layers[layer[state]].append(state)
+
+    # Barycenter sweeps, alternately down and up
+    neighbours = {state: [] for state in states}
+    for source, dest in forward:
+        neighbours[source].append(dest)
+        neighbours[dest].append(source)
+    for sweep in range(sweeps):
+        order = range(1, len(layers)) if sweep % 2 == 0 else range(len(layers) - 2, -1, -1)
+        for i in order:
+            fixed = layers[i - 1] if sweep % 2 == 0 else layers[i + 1]
+            position = {state: p for p, state in enumerate(fixed)}
+            # The list is empty while it is being sorted, keep the current order aside
+            current = {state: p for p, state in enumerate(layers[i])}
+
+            def barycenter(state):
+                linked = [position[n] for n in neighbours[state] if n in position]
+                return sum(linked) / len(linked) if linked else current[state]
+
+            layers[i].sort(key=barycenter)
+
+    width = max(len(states_in_layer) for states_in_layer in layers) if layers else 1
+    positions = {}
+    for i, states_in_layer in enumerate(layers):
+        offset = (width - len(states_in_layer)) * NODE_GAP / 2
+        for j, state in enumerate(states_in_layer):
+            positions[state] = (
+                MARGIN + NODE_RX + offset + j * NODE_GAP,
+                MARGIN + NODE_RY + i * LAYER_GAP,
+            )
+    return positions
+
+
+def render_svg(markup):
+    """
+    Draws a machine's states with its transitions as arrows.
+
+    Every state is a <g class="state" data-state="..."> and the drawing holds
+    no runtime state, so it can be cached and the page only has to move the
+    "active" class around when the state changes.
+    """
+    graph = definition(markup)
+    states = graph["states"]
+
+    # One arrow per (source, dest) pair, labelled with all of its triggers
+    edges = {}
+    for source, dest, trigger in graph["transitions"]:
+        edges.setdefault((source, dest), []).append(trigger)
+
+    positions = layered_layout(states, list(edges), graph["initial"])
+    width = max((x for x, _ in positions.values()), default=0) + NODE_RX + MARGIN
+    height = max((y for _, y in positions.values()), default=0) + NODE_RY + MARGIN
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width:.0f} {height:.0f}">',
+        '<defs><marker id="arrow" viewBox="0 0 10 10" refX="10" refY="5" '
+        'markerWidth="8" markerHeight="8" orient="auto-start-reverse">'
+        '<path d="M 0 0 L 10 5 L 0 10 z"/></marker></defs>',
+    ]
+    for (source, dest), triggers in edges.items():
+        if source not in positions or dest not in positions:
+            continue
+        label = html.escape(", ".join(triggers))
+        x1, y1 = positions[source]
+        x2, y2 = positions[dest]
+        if source == dest:
+            # Loop to the right of the state
+            parts.append(
+                f'<path class="transition" d="M {x1 + NODE_RX - 10:.1f} {y1 - 10:.1f} '
+                f'C {x1 + NODE_RX + 50:.1f} {y1 - 40:.1f} {x1 + NODE_RX + 50:.1f} {y1 + 40:.1f} '
+                f'{x1 + NODE_RX - 10:.1f} {y1 + 10:.1f}" marker-end="url(#arrow)"/>'
+                f'<text class="trigger" x="{x1 + NODE_RX + 45:.1f}" y="{y1 + 4:.1f}">{label}</text>'
+            )
+            continue
+
+        # Shorten the arrow to the node borders, bend it when both directions
+        # exist or when it goes back up against the flow
+        dx, dy = x2 - x1, y2 - y1
+        length = math.hypot(dx, dy)
+        ux, uy = dx / length, dy / length
+        shrink = 1 / math.hypot(ux / NODE_RX, uy / NODE_RY)
+        sx, sy = x1 + ux * shrink, y1 + uy * shrink
+        ex, ey = x2 - ux * shrink, y2 - uy * shrink
+        bend = 0.0
+        if (dest, source) in edges:
+            bend = 30.0
+        if y2 < y1:
+            bend = max(bend, 0.25 * length)
+        mx, my = (sx + ex) / 2 - uy * bend, (sy + ey) / 2 + ux * bend
+        parts.append(
+            f'<path class="transition" d="M {sx:.1f} {sy:.1f} Q {mx:.1f} {my:.1f} '
+            f'{ex:.1f} {ey:.1f}" marker-end="url(#arrow)"/>'
+            f'<text class="trigger" x="{mx:.1f}" y="{my - 4:.1f}">{label}</text>'
+        )
+
+    for state, (x, y) in positions.items():
+        name = html.escape(state)
+        parts.append(
+            f'<g class="state" data-state="{name}">'
+            f'<ellipse cx="{x:.1f}" cy="{y:.1f}" rx="{NODE_RX:.0f}" ry="{NODE_RY:.0f}"/>'
+            f'<text x="{x:.1f}" y="{y + 4:.1f}">{name}</text></g>'
+        )
+    parts.append("</svg>")
+    return "".join(parts)
+
+
+def default_cache_dir():
+    return os.environ.get("STATE_MACHINES_LAYOUT_CACHE") or os.path.join(
+        os.path.expanduser("~"), ".cache", "state_machines", "layouts"
+    )
+
+
+class LayoutCache:
+    """
+    Rendered graphs on disk, one SVG file per machine definition.
+
+    Files are named after definition_key(), so a machine whose states and
+    transitions did not change is served from the file on the next start
+    instead of being laid out again, and any change to the definition (or to
+    LAYOUT_VERSION) leads to a new file. The `memory_size` most recently used
+    graphs are also kept in memory, since a machine re-sends its markup while
+    it is being built.
+    """
+
+    def __init__(self, directory=None, memory_size=64):
+        self.directory = directory or default_cache_dir()
+        self.memory_size = memory_size
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.svg")
+
+    def get(self, markup):
+        key = definition_key(markup)
+        svg = self._memory.get(key)
+        if svg is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return svg
+
+        try:
+            with open(self.path(key), encoding="utf-8") as f:
+                svg = f.read()
+            self.hits += 1
+        except OSError:
+            self.misses += 1
+            svg = render_svg(markup)
+            self._store(key, svg)
+
+        self._memory[key] = svg
+        if len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)  # Least recently used
+        return svg
+
+    def _store(self, key, svg):
+        # Write to a temporary file first, so a crash never leaves half a graph behind
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(svg)
+            os.replace(temp_path, self.path(key))
+        except OSError as exc:
+            logging.warning(f"Could not cache the graph layout in {self.directory}: {exc}")
@@ -0,0 +1,125 @@
+import os
+import logging
+import threading
+
+# Pushes per second when nothing else is configured
+DEFAULT_RATE = 20.0
+
+
+class GuiPusher:
+    """
+    Decouples state changes from the web layer.
+
+    A WebMachine sends a GUI message inside every transition. Through the
+    pusher, the transition only records the message in a bounded table keyed
+    by (target, machine, model) and returns; a background thread pushes the
+    table `rate` times per second. A burst of transitions of one model in
+    between becomes a single push of its latest state, with the number of
+    transitions it stands for in arg["transitions"]. Once `max_pending`
+    different models are waiting, updates of further models are dropped and
+    counted instead of blocking the trigger.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, max_pending=1024):
+        self.interval = 1.0 / rate
+        self.max_pending = max_pending
+
+        self.pushed = 0
+        self.coalesced = 0  # Transitions folded into a later push
+        self.dropped = 0
+
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def submit(self, send, message, port):
+        arg = message.get("arg") or {}
+        key = (send, port, message.get("method"), arg.get("model"))
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is not None:
+                entry[0] = message
+                entry[1] += 1
+            elif len(self._pending) < self.max_pending:
+                self._pending[key] = [message, 1]
+            else:
+                self.dropped += 1
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="GuiPusher", daemon=True)
+                self._thread.start()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        for (send, port, _, _), (message, count) in pending.items():
+            if count > 1:
+                message = dict(message, arg=dict(message["arg"], transitions=count))
+                self.coalesced += count - 1
+            try:
+                send(message, port)
+                self.pushed += 1
+            except Exception:
+                logging.exception("GUI push failed")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+
+class CoalescedHandler:
+    """
+    Stands in for a machine's websocket_handler and hands its messages to a GuiPusher.
+    """
+
+    def __init__(self, pusher, send):
+        self.pusher = pusher
+        self.send = send
+
+    def send_message(self, message, port):
+        self.pusher.submit(self.send, message, port)
+
+
+_pushers = {}
+_pushers_lock = threading.Lock()
+
+
+def default_pusher(rate=DEFAULT_RATE):
+    # One pusher thread per process and rate, shared by all of its machines
+    with _pushers_lock:
+        key = (os.getpid(), rate)
+        if key not in _pushers:
+            _pushers[key] = GuiPusher(rate)
+        return _pushers[key]
+
+
+def coalesce(machine, pusher=None):
+    """
+    Routes `machine`'s GUI messages through `pusher` (default: this process's
+    DEFAULT_RATE pusher) and returns the pusher.
+    """
+    pusher = pusher or default_pusher()
+    handler = machine.websocket_handler
+
+    if isinstance(handler, type):
+        # transitions_gui's tornado WebSocketHandler, only safe on the server's IOLoop
+        def send(message, port):
+            loop = getattr(machine, "_iloop", None)
+            if loop is None:
+                handler.send_message(message, port)
+            else:
+                loop.add_callback(handler.send_message, message, port)
+
+    else:
+        send = handler.send_message
+
+    machine.websocket_handler = CoalescedHandler(pusher, send)
+    return pusher
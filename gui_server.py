@@ -0,0 +1,457 @@
+import os
+import json
+import errno
+import html
+import logging
+import argparse
+import threading
+import itertools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.connection import Client, Listener
+
+from transitions_gui import WebMachine
+
+from graph_layout import LayoutCache
+
+# Browsers connect to the HTTP port, machines register through the channel
+HTTP_HOST = "localhost"
+HTTP_PORT = 8080
+ADDRESS = ("localhost", 8079)
+
+# Seconds between keep-alive comments on idle event streams
+KEEPALIVE = 15.0
+
+
+def authkey_path():
+    runtime = os.environ.get("XDG_RUNTIME_DIR") or os.path.join(
+        os.path.expanduser("~"), ".cache", "state_machines"
+    )
+    return os.environ.get("STATE_MACHINES_GUI_AUTHKEY") or os.path.join(runtime, "gui_authkey")
+
+
+def load_authkey(path=None):
+    """
+    The channel's authentication key, random per user.
+
+    Read from `path` (see authkey_path()), or created there on first use with
+    mode 0600, so the server and every machine of the same user share it and
+    other users cannot register machines.
+    """
+    path = path or authkey_path()
+    try:
+        with open(path, "rb") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    key = os.urandom(32).hex().encode("ascii")
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except OSError as exc:
+        if exc.errno != errno.EEXIST:
+            raise
+        # Another process created it first
+        with open(path, "rb") as f:
+            return f.read().strip()
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+class MachineView:
+    """
+    What the server knows about one registered machine.
+    """
+
+    def __init__(self, key, markup, layouts):
+        self.key = key
+        self.layouts = layouts
+        self.update_markup(markup)
+        self.transitions = 0
+        self.last_transition = None
+        self.version = 0
+
+    def update_markup(self, markup):
+        self.markup = markup
+        self.name = markup.get("name") or self.key
+        models = markup.get("models") or []
+        self.state = models[0]["state"] if models else markup.get("initial")
+        # Laid out once per definition, re-registrations and restarts hit the cache
+        self.svg = self.layouts.get(markup)
+
+    def snapshot(self):
+        return {
+            "key": self.key,
+            "name": self.name,
+            "state": self.state,
+            "transitions": self.transitions,
+            "last_transition": self.last_transition,
+        }
+
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8"/>
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 1em 2em; }}
+svg {{ max-width: 100%; height: auto; }}
+.state ellipse {{ fill: #fff; stroke: #333; stroke-width: 2; }}
+.state.active ellipse {{ fill: #ffd54f; }}
+.state text, .trigger {{ text-anchor: middle; font-size: 12px; }}
+.trigger {{ fill: #555; }}
+.transition {{ fill: none; stroke: #777; stroke-width: 1.5; }}
+</style>
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+SCRIPT = """<script>
+const status = document.getElementById("status");
+const source = new EventSource("/events/{key}");
+source.onmessage = (event) => {{
+  const machine = JSON.parse(event.data);
+  document.querySelectorAll(".state").forEach((node) =>
+    node.classList.toggle("active", node.dataset.state === machine.state));
+  status.textContent = `${{machine.state}} (${{machine.transitions}} transitions)`;
+}};
+source.addEventListener("removed", () => {{
+  status.textContent = "machine disconnected";
+  source.close();
+}});
+</script>"""
+
+
+class GuiServer:
+    """
+    One visualisation server for any number of machines in any number of processes.
+
+    Machines (see SharedWebMachine) register their markup and send their state
+    changes over a multiprocessing.connection channel; browsers get an index
+    of all machines, one SVG graph per machine and its state changes as
+    server-sent events, all on a single HTTP port. The server forgets a
+    machine when its process disconnects.
+    """
+
+    def __init__(self, http_port=HTTP_PORT, address=ADDRESS, authkey=None, layouts=None, http_host=HTTP_HOST):
+        self.http_host = http_host
+        self.http_port = http_port
+        self.address = address
+        self.authkey = authkey or load_authkey()
+        self.layouts = layouts or LayoutCache()
+        self.machines = {}
+        self.changed = threading.Condition()
+        self._listener = None
+        self._http = None
+
+    # Machine side
+    def _accept(self):
+        while True:
+            try:
+                connection = self._listener.accept()
+            except OSError:
+                return  # Listener closed
+            except Exception as exc:
+                logging.warning(f"Rejected GUI client: {exc}")
+                continue
+            threading.Thread(target=self._serve_client, args=(connection,), daemon=True).start()
+
+    def _serve_client(self, connection):
+        keys = set()
+        try:
+            while True:
+                # JSON, not pickle: a message can never run code in the server
+                try:
+                    kind, key, payload = json.loads(connection.recv_bytes())
+                except ValueError as exc:
+                    logging.warning(f"Dropping GUI client after a malformed message: {exc}")
+                    return
+
+                # A machine that cannot be shown must not take the process's other machines along
+                try:
+                    if kind == "register":
+                        keys.add(key)
+                        self.register(key, payload)
+                    elif kind == "message":
+                        self.handle_message(key, payload)
+                    elif kind == "unregister":
+                        keys.discard(key)
+                        self.unregister(key)
+                except Exception:
+                    logging.exception(f"Could not handle {kind!r} of GUI machine {key}")
+        except (EOFError, OSError):
+            pass
+        finally:
+            connection.close()
+            for key in keys:
+                self.unregister(key)
+
+    def register(self, key, markup):
+        with self.changed:
+            view = self.machines.get(key)
+            if view is None:
+                self.machines[key] = view = MachineView(key, markup, self.layouts)
+                logging.info(f"Registered {view.name} ({key})")
+            else:
+                view.update_markup(markup)
+            view.version += 1
+            self.changed.notify_all()
+
+    def handle_message(self, key, message):
+        with self.changed:
+            view = self.machines.get(key)
+            if view is None or message.get("method") != "state_changed":
+                return
+            view.state = message["arg"]["state"]
+            view.last_transition = message["arg"]["transition"]
+            # Coalesced pushes stand for several transitions (see gui_push)
+            view.transitions += message["arg"].get("transitions", 1)
+            view.version += 1
+            self.changed.notify_all()
+
+    def unregister(self, key):
+        with self.changed:
+            view = self.machines.pop(key, None)
+            if view is not None:
+                logging.info(f"Unregistered {view.name} ({key})")
+                view.version = -1  # Tells open event streams the machine is gone
+            self.changed.notify_all()
+
+    # Browser side
+    def index_page(self):
+        with self.changed:
+            rows = [
+                f'<li><a href="/machine/{html.escape(view.key)}">{html.escape(view.name)}</a>: '
+                f"{html.escape(str(view.state))} ({view.transitions} transitions)</li>"
+                for view in self.machines.values()
+            ]
+        body = (
+            '<meta http-equiv="refresh" content="5"/><h1>State machines</h1>'
+            f"<ul>{''.join(rows) or '<li>No machines registered</li>'}</ul>"
+        )
+        return PAGE.format(title="State machines", body=body)
+
+    def machine_page(self, key):
+        with self.changed:
+            view = self.machines.get(key)
+            if view is None:
+                return None
+            name, svg = html.escape(view.name), view.svg
+        body = (
+            f'<p><a href="/">All machines</a></p><h1>{name}</h1>'
+            f'<p id="status"></p>{svg}{SCRIPT.format(key=html.escape(key))}'
+        )
+        return PAGE.format(title=name, body=body)
+
+    def stream_events(self, key, write):
+        # Pushes the machine's state on every change until it goes away or the browser leaves
+        last_version = None
+        while True:
+            with self.changed:
+                # Other machines' changes wake us too, only this one's count
+                self.changed.wait_for(
+                    lambda: key not in self.machines or self.machines[key].version != last_version,
+                    KEEPALIVE,
+                )
+                view = self.machines.get(key)
+                if view is None:
+                    snapshot = None
+                elif view.version == last_version:
+                    snapshot = {}  # Timed out, just keep the connection open
+                else:
+                    last_version = view.version
+                    snapshot = view.snapshot()
+
+            if snapshot is None:
+                write("event: removed\ndata: {}\n\n")
+                return
+            write(f"data: {json.dumps(snapshot)}\n\n" if snapshot else ": keep-alive\n\n")
+
+    def snapshot(self):
+        with self.changed:
+            return [view.snapshot() for view in self.machines.values()]
+
+    def serve_forever(self):
+        self._listener = Listener(self.address, authkey=self.authkey)
+        threading.Thread(target=self._accept, daemon=True).start()
+
+        self._http = ThreadingHTTPServer((self.http_host, self.http_port), GuiRequestHandler)
+        self._http.daemon_threads = True
+        self._http.gui = self
+        logging.info(
+            f"GUI server on http://{self.http_host or '0.0.0.0'}:{self.http_port}, "
+            f"machines register at {self.address[0]}:{self.address[1]}"
+        )
+        try:
+            self._http.serve_forever()
+        finally:
+            self._listener.close()
+            self._http.server_close()
+
+    def shutdown(self):
+        if self._http is not None:
+            self._http.shutdown()
+
+
+class GuiRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def _send(self, body, content_type="text/html; charset=utf-8", status=200):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        gui = self.server.gui
+        path = self.path.split("?")[0]
+
+        if path == "/":
+            self._send(gui.index_page())
+        elif path == "/machines.json":
+            self._send(json.dumps(gui.snapshot()), "application/json")
+        elif path.startswith("/machine/"):
+            page = gui.machine_page(path[len("/machine/") :])
+            if page is None:
+                self._send("Unknown machine", "text/plain", 404)
+            else:
+                self._send(page)
+        elif path.startswith("/events/"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+
+            def write(chunk):
+                self.wfile.write(chunk.encode("utf-8"))
+                self.wfile.flush()
+
+            try:
+                gui.stream_events(path[len("/events/") :], write)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # Browser went away
+        else:
+            self._send("Not found", "text/plain", 404)
+
+
+class GuiClient:
+    """
+    A process's connection to the GuiServer, shared by all of its machines.
+
+    It doubles as the `websocket_handler` of a WebMachine: transitions_gui
+    calls send_message(message, port) on every state change, and the machine's
+    port is its key on the server. Without a running server the client logs a
+    warning once and drops everything.
+    """
+
+    def __init__(self, address=ADDRESS, authkey=None):
+        self.address = address
+        self._lock = threading.Lock()
+        self._keys = itertools.count()
+        try:
+            self._connection = Client(address, authkey=authkey or load_authkey())
+        except OSError as exc:
+            logging.warning(f"No GUI server at {address[0]}:{address[1]} ({exc}), running without GUI")
+            self._connection = None
+
+    def new_key(self):
+        return f"{os.getpid()}-{next(self._keys)}"
+
+    def send(self, kind, key, payload=None):
+        with self._lock:
+            if self._connection is None:
+                return
+            try:
+                self._connection.send_bytes(json.dumps([kind, key, payload]).encode("utf-8"))
+            except OSError as exc:
+                logging.warning(f"Lost the GUI server ({exc}), running without GUI")
+                self._connection = None
+
+    def send_message(self, message, port):
+        self.send("message", port, message)
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def connect(address=ADDRESS, authkey=None):
+    # One client per process and server; a forked child opens its own connection
+    with _clients_lock:
+        key = (os.getpid(), tuple(address))
+        if key not in _clients:
+            _clients[key] = GuiClient(address, authkey)
+        return _clients[key]
+
+
+class SharedWebMachine(WebMachine):
+    """
+    WebMachine that shows up on the shared GuiServer instead of starting its own server.
+
+    Takes the same arguments as WebMachine; `port` is ignored, `gui_client`
+    defaults to this process's connection to the server at ADDRESS.
+    """
+
+    def __init__(self, *args, gui_client=None, **kwargs):
+        kwargs.pop("port", None)
+        client = gui_client or connect()
+        self.gui_client = None  # No markup updates while the base class sets things up
+        super().__init__(*args, websocket_handler=client, **kwargs)
+        self.port = client.new_key()
+        self.gui_client = client
+        self.publish_markup()
+
+    def publish_markup(self):
+        self.gui_client.send("register", self.port, self.markup)
+
+    def add_states(self, *args, **kwargs):
+        super().add_states(*args, **kwargs)
+        if self.gui_client is not None:
+            self.publish_markup()
+
+    def add_transition(self, *args, **kwargs):
+        super().add_transition(*args, **kwargs)
+        if self.gui_client is not None:
+            self.publish_markup()
+
+    def stop_server(self):
+        self.gui_client.send("unregister", self.port)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared state machine GUI server")
+    parser.add_argument(
+        "--host", default=HTTP_HOST, help="Interface for browsers, e.g. 0.0.0.0 for all (default localhost)"
+    )
+    parser.add_argument("--port", type=int, default=HTTP_PORT, help="HTTP port for browsers")
+    parser.add_argument("--channel-port", type=int, default=ADDRESS[1], help="Port machines register on")
+    parser.add_argument("--layout-cache", help="Directory for cached graph layouts")
+    args = parser.parse_args()
+
+    # Setup logging
+    logging.basicConfig(level=logging.INFO)
+
+    server = GuiServer(
+        http_host=args.host,
+        http_port=args.port,
+        address=(ADDRESS[0], args.channel_port),
+        layouts=LayoutCache(args.layout_cache),
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,398 @@
+import os
+import time
+import logging
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Quantiles in the text export; 1 is the exact maximum
+QUANTILES = (0.5, 0.9, 0.99, 0.999, 1.0)
+
+
+class Histogram:
+    """
+    Latency histogram with HdrHistogram-style log-linear buckets.
+
+    Values are integer nanoseconds. Below 2**sub_bucket_bits every value has
+    its own bucket, above that every power of two is split into
+    2**(sub_bucket_bits - 1) equal buckets, so any recorded value is known to
+    within 1 / 2**(sub_bucket_bits - 1) (0.8 % with the default 8 bits) from
+    nanoseconds to `max_value` (about 73 minutes) in a few thousand counters.
+    Recording is an index computation and an increment, no allocation and
+    no lock; one thread records, any thread may read.
+    """
+
+    def __init__(self, sub_bucket_bits=8, max_value=1 << 42):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.half = 1 << (sub_bucket_bits - 1)
+        self.max_value = max_value
+        self.counts = [0] * (self._index(max_value) + 1)
+
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value):
+        shift = value.bit_length() - self.sub_bucket_bits
+        if shift <= 0:
+            return value
+        return (shift << (self.sub_bucket_bits - 1)) + (value >> shift)
+
+    def _highest_equivalent(self, index):
+        # Largest value that lands in bucket `index`
+        if index < 2 * self.half:
+            return index
+        shift = index // self.half - 1
+        return ((index - shift * self.half + 1) << shift) - 1
+
+    def record(self, value):
+        value = min(max(value, 0), self.max_value)
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def percentile(self, q):
+        """
+        Value below which a fraction `q` of the recorded values lie, 0 when empty.
+        """
+        if self.count == 0:
+            return 0
+        if q >= 1.0:
+            return self.max
+
+        rank = max(1, int(q * self.count + 0.5))
+        seen = 0
+        for index, count in enumerate(list(self.counts)):
+            seen += count
+            if seen >= rank:
+                return min(self._highest_equivalent(index), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "min": self.min or 0,
+            "max": self.max,
+            **{f"p{q * 100:g}": self.percentile(q) for q in QUANTILES[:-1]},
+        }
+
+
+class TimedActions(dict):
+    """
+    A model's state_action_map that notes when each action starts.
+
+    run_actions looks actions up with get(), so wrapping them there times
+    every action, including ones a caller puts into the map later (like
+    PlantOrchestrator does with update()).
+    """
+
+    def __init__(self, metrics, actions):
+        super().__init__(actions)
+        self.metrics = metrics
+
+    def _timed(self, action):
+        def timed(*args, **kwargs):
+            self.metrics.action_started = time.perf_counter_ns()
+            return action(*args, **kwargs)
+
+        return timed
+
+    def __getitem__(self, state):
+        return self._timed(super().__getitem__(state))
+
+    def get(self, state, default=None):
+        action = super().get(state, default)
+        return None if action is None else self._timed(action)
+
+
+class MachineMetrics:
+    """
+    Latency and dwell time histograms of one model's machine.
+
+    Per trigger:
+    - transition: from the machine's before_state_change callbacks to the end
+      of the transition's after callbacks, i.e. the time spent in the
+      machine's own logic and callbacks;
+    - action: from the start of the model's state_action_map action to the
+      end of the transition it caused, i.e. including the wait for the
+      Arduino, the gantry or a handoff.
+    Per state:
+    - dwell: time from entering the state to leaving it. Dwell minus the
+      following action is time spent idle, e.g. in run_actions' min_dwell.
+
+    Works with transitions machines and CompiledMachine. On a machine with
+    several models only one model should be instrumented, the callbacks
+    cannot tell the models apart.
+    """
+
+    def __init__(self, model, machine=None, name=None):
+        self.model = model
+        self.machine = model.machine if machine is None else machine
+        self.name = name or getattr(self.machine, "name", "").rstrip(": ") or type(model).__name__
+
+        self.transitions = {}
+        self.actions = {}
+        self.dwell = {}
+
+        self.action_started = None
+        self._transition_started = None
+        self._state = model.state
+        self._entered = time.perf_counter_ns()
+
+    def attach(self):
+        self.machine.before_state_change.insert(0, self._started)
+
+        if hasattr(self.machine, "events"):
+            # A transitions machine: one after callback per transition, like EventRing.attach
+            for event in self.machine.events.values():
+                for transitions in event.transitions.values():
+                    for transition in transitions:
+                        transition.add_callback("after", self._recorder(event.name))
+        else:
+            for trigger in self.machine.triggers:
+                self.machine.add_transition_callback(trigger, "after", self._recorder(trigger))
+
+        if isinstance(getattr(self.model, "state_action_map", None), dict):
+            self.model.state_action_map = TimedActions(self, self.model.state_action_map)
+        return self
+
+    def _started(self, *args, **kwargs):
+        self._transition_started = time.perf_counter_ns()
+
+    def _recorder(self, trigger):
+        transition = self.transitions[trigger] = self.transitions.get(trigger) or Histogram()
+        action = self.actions[trigger] = self.actions.get(trigger) or Histogram()
+
+        def record(*args, **kwargs):
+            now = time.perf_counter_ns()
+            if self._transition_started is not None:
+                transition.record(now - self._transition_started)
+                self._transition_started = None
+            if self.action_started is not None:
+                action.record(now - self.action_started)
+                self.action_started = None
+
+            dwell = self.dwell.get(self._state)
+            if dwell is None:
+                dwell = self.dwell[self._state] = Histogram()
+            dwell.record(now - self._entered)
+            self._state = self.model.state
+            self._entered = now
+
+        return record
+
+    def summary(self):
+        return {
+            kind: {label: histogram.summary() for label, histogram in histograms.items()}
+            for kind, histograms in (
+                ("transition", self.transitions),
+                ("action", self.actions),
+                ("dwell", self.dwell),
+            )
+        }
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def labels(**values):
+    return ",".join(f'{name}="{_label(value)}"' for name, value in values.items())
+
+
+def summary_lines(family, label_text, histogram):
+    # One Prometheus summary of a nanosecond histogram, in seconds
+    lines = []
+    for q in QUANTILES:
+        value = histogram.percentile(q) / 1e9
+        lines.append(f'{family}{{{label_text},quantile="{q:g}"}} {value:.9f}')
+    lines.append(f"{family}_sum{{{label_text}}} {histogram.total / 1e9:.9f}")
+    lines.append(f"{family}_count{{{label_text}}} {histogram.count}")
+    return lines
+
+
+class MetricsRegistry:
+    """
+    All instrumented machines of a process, rendered in the Prometheus text format.
+
+    Other sources (e.g. serial_stats.SerialStats) are added with add_source()
+    and describe themselves through metric_families(), a dict of
+    (family, type) -> sample lines; the families of all sources are merged
+    so every family is one group like the format requires.
+    """
+
+    families = (
+        ("transition", "trigger", "Time spent in the transition's logic and callbacks"),
+        ("action", "trigger", "Time from the start of an action to the end of its transition"),
+        ("dwell", "state", "Time spent in a state"),
+    )
+
+    def __init__(self):
+        self.machines = []
+        self.sources = []
+        self._lock = threading.Lock()
+
+    def add(self, metrics):
+        with self._lock:
+            self.machines.append(metrics)
+        return metrics
+
+    def add_source(self, source):
+        with self._lock:
+            self.sources.append(source)
+        return source
+
+    def render(self):
+        with self._lock:
+            machines = list(self.machines)
+            sources = list(self.sources)
+
+        lines = []
+        for kind, label_name, help_text in self.families:
+            family = f"state_machine_{kind}_seconds"
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} summary")
+            for metrics in machines:
+                histograms = getattr(metrics, kind if kind == "dwell" else kind + "s")
+                for label, histogram in list(histograms.items()):
+                    if histogram.count == 0:
+                        continue
+                    label_text = labels(machine=metrics.name, **{label_name: label})
+                    lines += summary_lines(family, label_text, histogram)
+
+        merged = {}
+        for source in sources:
+            for family, samples in source.metric_families().items():
+                merged.setdefault(family, []).extend(samples)
+        for (family, kind), samples in merged.items():
+            lines.append(f"# TYPE {family} {kind}")
+            lines += samples
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def instrument(model, machine=None, name=None, registry=REGISTRY):
+    """
+    Starts recording `model`'s transition, action and dwell times; returns its MachineMetrics.
+    """
+    return registry.add(MachineMetrics(model, machine, name).attach())
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        data = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class MetricsServer:
+    """
+    Serves the registry on http://host:port/metrics from a background thread.
+
+    Nothing is computed between scrapes; the percentiles are worked out when
+    a request comes in. Binds to localhost by default.
+    """
+
+    def __init__(self, port=9108, host="localhost", registry=REGISTRY):
+        self.address = (host, port)
+        self.registry = registry
+        self._http = None
+        self._thread = None
+
+    def start(self):
+        self._http = ThreadingHTTPServer(self.address, MetricsRequestHandler)
+        self._http.daemon_threads = True
+        self._http.registry = self.registry
+        self._thread = threading.Thread(
+            target=self._http.serve_forever, name="MetricsServer", daemon=True
+        )
+        self._thread.start()
+        logging.info(f"Metrics on http://{self.address[0]}:{self.address[1]}/metrics")
+        return self
+
+    def stop(self):
+        if self._http is not None:
+            self._http.shutdown()
+            self._http.server_close()
+            self._thread.join()
+            self._http = None
+
+
+class MetricsDump:
+    """
+    Writes the registry to `path` every `interval` seconds and once more on stop().
+
+    The file is replaced atomically, so it can be read at any time, e.g. by
+    node_exporter's textfile collector.
+    """
+
+    def __init__(self, path, interval=10.0, registry=REGISTRY):
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self._stop = threading.Event()
+        self._thread = None
+
+    def dump(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(self.registry.render())
+            os.replace(temp_path, self.path)
+        except OSError as exc:
+            logging.warning(f"Could not write metrics to {self.path}: {exc}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.dump()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="MetricsDump", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.dump()
+
+
+def export_from_env(registry=REGISTRY):
+    """
+    Starts the exporters configured in the environment and returns them.
+
+    STATE_MACHINES_METRICS_PORT serves /metrics on that localhost port,
+    STATE_MACHINES_METRICS_FILE dumps to that file every
+    STATE_MACHINES_METRICS_INTERVAL seconds (default 10). Neither is on by default.
+    """
+    exporters = []
+    if os.environ.get("STATE_MACHINES_METRICS_PORT"):
+        port = int(os.environ["STATE_MACHINES_METRICS_PORT"])
+        exporters.append(MetricsServer(port, registry=registry).start())
+    if os.environ.get("STATE_MACHINES_METRICS_FILE"):
+        interval = float(os.environ.get("STATE_MACHINES_METRICS_INTERVAL", 10.0))
+        exporters.append(
+            MetricsDump(os.environ["STATE_MACHINES_METRICS_FILE"], interval, registry).start()
+        )
+    return exporters
@@ -1,24 +1,203 @@
+import sys
+import time
 import logging
-
-from multiprocessing import Process, Manager
+import threading
+from concurrent.futures import CancelledError
 
 from rotational_table_pump import TablePumpStateMachine
 from rotational_table_measure import TableMeasureStateMachine
 from gantry_SM import GantryStateMachine
+from gantry_queue import GantryJobQueue
+from metrics import export_from_env
+from utils import stop_gui
 
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 
 
+class BottleHandoff:
+    """
+    Rendezvous for one bottle moving from the pump table to the measure table.
+
+    Both tables meet at `ready`; the pump side then moves the bottle with the
+    gantry and completes its own transition before both meet again at `done`,
+    which lets the measure table take the bottle.
+    """
+
+    def __init__(self):
+        self.ready = threading.Barrier(2)
+        self.done = threading.Barrier(2)
+
+    def abort(self):
+        self.ready.abort()
+        self.done.abort()
+
+
+class PlantOrchestrator:
+    """
+    Runs the pump table, the measure table and the gantry concurrently.
+
+    Each table drives its own state_action_map in a thread, so the pump table
+    fills bottle N+1 while the measure table measures bottle N. The tables only
+    synchronise when a bottle is handed over (Pump_to_measure_And_FillBottle on
+    the pump side, the Pump_to_measure transitions on the measure side) and
+    share the gantry through its job queue.
+    """
+
+    # Handoffs keep both tables waiting, emptying the measure table keeps it busy
+    job_priorities = {"Pump_to_measure": 2, "Measure_to_tray": 1, "Tray_to_pump": 0}
+
+    def __init__(self, pump_port="COM8", gui_ports=(8083, 8085, 8086), gui=None):
+        self.pump_table = TablePumpStateMachine(
+            port=pump_port, gui_port=gui_ports[0], gui=gui
+        )
+        self.measure_table = TableMeasureStateMachine(gui_port=gui_ports[1], gui=gui)
+        self.gantry = GantryStateMachine(gui_port=gui_ports[2], gui=gui)
+
+        self.gantry_queue = GantryJobQueue(self.gantry)
+        self.handoff = BottleHandoff()
+        self.stop_event = threading.Event()
+        self.bottles_done = 0
+        self.cycle_times = {}
+
+        pump = self.pump_table
+        pump.state_action_map.update(
+            {
+                "Empty_Empty": lambda: self._after_move("Tray_to_pump", pump.Tray_to_pump),
+                "BottleEmpty_Empty": lambda: self._after_move(
+                    "Tray_to_pump", pump.FillBottle_And_Tray_to_pump
+                ),
+                "BottleEmpty_BottleFull": self._send_bottle,
+                "BottleFull_Empty": lambda: self._after_move("Tray_to_pump", pump.Tray_to_pump),
+            }
+        )
+
+        measure = self.measure_table
+        measure.state_action_map.update(
+            {
+                "Empty_Empty_Empty": lambda: self._receive_bottle(measure.Pump_to_measure),
+                "Bottle_Empty_Empty": lambda: self._receive_bottle(
+                    measure.UV_Measure_And_Pump_to_measure
+                ),
+                "Bottle_BottleM1_Empty": lambda: self._receive_bottle(
+                    measure.Pump_to_measure_And_UV_measure_And_DLS_measure
+                ),
+                "Bottle_BottleM1_BottleM2": self._release_bottle,
+                "BottleM1_BottleM2_Empty": lambda: self._receive_bottle(
+                    measure.Pump_to_measure
+                ),
+            }
+        )
+
+    def move(self, job):
+        # Wait for the gantry to carry out the job; False if the plant stopped first
+        future = self.gantry_queue.submit(job, priority=self.job_priorities[job])
+        try:
+            future.result()
+        except CancelledError:
+            return False
+        return True
+
+    def _after_move(self, job, action):
+        if self.move(job):
+            action()
+
+    def _send_bottle(self):
+        try:
+            self.handoff.ready.wait()
+            if self.move("Pump_to_measure"):
+                self.pump_table.Pump_to_measure_And_FillBottle()
+            self.handoff.done.wait()
+        except threading.BrokenBarrierError:
+            logging.info("Pump table handoff aborted")
+
+    def _receive_bottle(self, action):
+        try:
+            self.handoff.ready.wait()
+            self.handoff.done.wait()
+        except threading.BrokenBarrierError:
+            logging.info("Measure table handoff aborted")
+            return
+        action()
+
+    def _release_bottle(self):
+        if self.move("Measure_to_tray"):
+            self.measure_table.Measure_to_tray_And_UV_measure_And_DLS_measure()
+            self.bottles_done += 1
+
+    def _run_table(self, name, table):
+        self.cycle_times[name] = table.auto_run(stop=self.stop_event)
+
+    def run(self, duration=None, max_bottles=None, report_interval=10.0):
+        """
+        Runs the plant until `duration` seconds have passed, `max_bottles`
+        bottles are finished or Ctrl+C, and returns the achieved throughput.
+        """
+        threads = [
+            threading.Thread(target=self._run_table, args=("pump", self.pump_table)),
+            threading.Thread(target=self._run_table, args=("measure", self.measure_table)),
+        ]
+        start = time.monotonic()
+        next_report = start + report_interval
+        self.gantry_queue.start()
+        for thread in threads:
+            thread.start()
+
+        try:
+            while not self.stop_event.wait(0.1):
+                now = time.monotonic()
+                if duration is not None and now - start >= duration:
+                    break
+                if max_bottles is not None and self.bottles_done >= max_bottles:
+                    break
+                if now >= next_report:
+                    logging.info(
+                        f"{self.bottles_done} bottles, "
+                        f"{self.bottles_per_hour(now - start):.1f} bottles/hour"
+                    )
+                    next_report += report_interval
+        finally:
+            self.stop_event.set()
+            self.handoff.abort()
+            self.gantry_queue.stop()
+            for thread in threads:
+                thread.join()
+
+        elapsed = time.monotonic() - start
+        return {
+            "bottles": self.bottles_done,
+            "elapsed": elapsed,
+            "bottles_per_hour": self.bottles_per_hour(elapsed),
+            "cycle_times": self.cycle_times,
+            "gantry": self.gantry_queue.stats(),
+        }
+
+    def bottles_per_hour(self, elapsed):
+        return self.bottles_done / elapsed * 3600 if elapsed > 0 else 0.0
+
+    def stop_servers(self):
+        for machine in (self.pump_table, self.measure_table, self.gantry):
+            stop_gui(machine.machine)
+
+
 if __name__ == "__main__":
-    # Create the table state machine
-    table = TablePumpStateMachine()
+    # Create the plant, optionally with the pump table on another port (e.g. arduino_sim)
+    plant = PlantOrchestrator(pump_port=sys.argv[1] if len(sys.argv) > 1 else "COM8")
+    exporters = export_from_env()
 
     try:
-        # Start automatic state transitions
-        table.auto_run()
+        # Start all machines concurrently
+        result = plant.run()
 
     except KeyboardInterrupt:
         logging.info("Stopping the server...")
-        table.machine.stop_server()
+        result = None
+
+    finally:
+        plant.stop_servers()
+        for exporter in exporters:
+            exporter.stop()
+
+    if result:
+        logging.info(f"Throughput: {result['bottles_per_hour']:.1f} bottles/hour")
@@ -1,7 +1,11 @@
-from multiprocessing import Process, Manager
+from multiprocessing import Process, Lock
 import time
 from transitions import Machine
 
+from shm_state import SharedStateSlot
+from event_ring import EventRing
+from timer_wheel import TimerWheel
+
 
 class TrafficLightStateMachine(object):
     states = ["green", "yellow", "red"]
@@ -69,35 +73,54 @@ class Vehicle:
 
 
 def run_light(traffic_light):
-    while True:
-        time.sleep(2)
-        traffic_light.timeup()
+    def print_state(*args, **kwargs):
         print(f"Traffic light is now: {traffic_light.state}")
 
+    traffic_light.machine.after_state_change.append(print_state)
+
+    # The wheel's thread fires timeup 2 s after every change
+    wheel = TimerWheel()
+    for state in TrafficLightStateMachine.states:
+        wheel.timed_trigger(traffic_light, state, 2.0, "timeup")
+    wheel.start()
+    while True:
+        time.sleep(1)
+
 
-def run_car(traffic_light):
+def run_car(traffic_light, events):
     car = Vehicle()
+    reader = events.reader(start="oldest")
     while True:
         time.sleep(1)
         print(f"Traffic light is: {traffic_light.state}")
-        # Handle the traffic light state using the switcher pattern inside Vehicle
-        action_result = car.handle_traffic_light(traffic_light.state)
 
-        if action_result:
-            print(action_result)
+        # React to every change since the last look, not just the latest state
+        changes, lost = reader.read()
+        if lost:
+            print(f"Missed {lost} traffic light changes")
+        for change in changes:
+            # Handle the traffic light state using the switcher pattern inside Vehicle
+            action_result = car.handle_traffic_light(change.dest)
+
+            if action_result:
+                print(action_result)
 
 
 if __name__ == "__main__":
-    # Create a shared manager to share the traffic light state
-    with Manager() as manager:
-        shared_state = manager.Value(
-            "s", "green"
-        )  # 's' for string, initial state is "green"
+    # Share the traffic light state through shared memory instead of a Manager proxy
+    shared_state = SharedStateSlot(
+        states=TrafficLightStateMachine.states, create=True, lock=Lock()
+    )
+    shared_state.value = "green"  # Initial state is "green"
+    events = EventRing(create=True)
+
+    try:
         traffic_light = TrafficLightStateMachine(shared_state)
+        events.attach(traffic_light.machine)
 
         # Start processes
         p1 = Process(target=run_light, args=(traffic_light,))
-        p2 = Process(target=run_car, args=(traffic_light,))
+        p2 = Process(target=run_car, args=(traffic_light, events))
 
         p1.start()
         p2.start()
@@ -105,3 +128,10 @@ if __name__ == "__main__":
         # Wait for both processes to complete
         p1.join()
         p2.join()
+
+    finally:
+        # Clean up shared memory when done
+        shared_state.close()
+        shared_state.unlink()
+        events.close()
+        events.unlink()
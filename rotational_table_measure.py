@@ -1,6 +1,9 @@
-import time
 import logging
-from transitions_gui import WebMachine
+
+from compiled_machine import CompiledMachine
+from metrics import instrument, export_from_env
+from transition_journal import TransitionJournal, journal_path
+from utils import make_machine, stop_gui, run_actions
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -61,18 +64,55 @@ class TableMeasureStateMachine:
         },
     ]
 
-    def __init__(self):
-        # Initialize the state machine with shared state
-        self.machine = WebMachine(
-            model=self,
-            states=TableMeasureStateMachine.states,
-            transitions=TableMeasureStateMachine.transitions,
-            initial="Empty_Empty_Empty",
-            name="Rotational Table Pump",
-            ignore_invalid_triggers=True,
-            auto_transitions=False,
-            port=8083,
-        )
+    def __init__(self, gui_port=8083, compiled=False, gui=None, journal=None):
+        if compiled:
+            # Integer transition table for high-rate simulation and replay, no GUI
+            self.machine = CompiledMachine(
+                model=self,
+                states=TableMeasureStateMachine.states,
+                transitions=TableMeasureStateMachine.transitions,
+                initial="Empty_Empty_Empty",
+                name="Rotational Table Measure",
+                ignore_invalid_triggers=True,
+            )
+        else:
+            # Initialize the state machine with shared state
+            self.machine = make_machine(
+                model=self,
+                states=TableMeasureStateMachine.states,
+                transitions=TableMeasureStateMachine.transitions,
+                initial="Empty_Empty_Empty",
+                name="Rotational Table Measure",
+                ignore_invalid_triggers=True,
+                auto_transitions=False,
+                port=gui_port,
+                gui=gui,
+            )
+
+        # Map states to corresponding transitions
+        self.state_action_map = {
+            "Empty_Empty_Empty": self.Pump_to_measure,
+            "Empty_Empty_Bottle": self.Rotate,
+            "Bottle_Empty_Empty": self.UV_Measure_And_Pump_to_measure,
+            "BottleM1_Empty_Bottle": self.Rotate,
+            "Bottle_BottleM1_Empty": self.Pump_to_measure_And_UV_measure_And_DLS_measure,
+            "BottleM1_BottleM2_Bottle": self.Rotate,
+            "Bottle_BottleM1_BottleM2": self.Measure_to_tray_And_UV_measure_And_DLS_measure,
+            "BottleM1_BottleM2_Empty": self.Pump_to_measure,
+        }
+
+        # Resume where the journal left off; this table has no homing to skip
+        self.journal = None
+        if journal is not None:
+            self.journal = TransitionJournal(journal)
+            recovery = self.journal.recover(TableMeasureStateMachine.states)
+            if recovery.state is not None:
+                self.machine.set_state(recovery.state)
+                logging.info(f"Recovered state {recovery.state} from {journal}")
+            self.journal.attach(self.machine)
+
+        # Per-trigger latency and per-state dwell histograms (see metrics)
+        self.metrics = instrument(self)
 
     def Rotate(self):
         logging.info("Rotating table")
@@ -98,10 +138,26 @@ class TableMeasureStateMachine:
         logging.info("Stopping the process")
         self.trigger("stop")
 
+    def auto_run(self, min_dwell=0.0, max_cycles=None, stop=None):
+        """
+        Automatically transitions through the states as soon as each action finishes.
+
+        Returns the achieved cycle times, one per measured bottle.
+        """
+        return run_actions(
+            self,
+            cycle_state="BottleM1_BottleM2_Bottle",
+            min_dwell=min_dwell,
+            max_cycles=max_cycles,
+            stop=stop,
+        )
+
 
 if __name__ == "__main__":
     # Create the table state machine
-    table = TableMeasureStateMachine()
+    # With STATE_MACHINES_JOURNAL set, a restart resumes from the table's journal in there
+    table = TableMeasureStateMachine(journal=journal_path("table_measure"))
+    exporters = export_from_env()
 
     # Mapping user inputs to the respective state machine actions
     actions = {
@@ -135,4 +191,10 @@ if __name__ == "__main__":
 
     except KeyboardInterrupt:
         logging.info("Stopping the server...")
-        table.machine.stop_server()
+        stop_gui(table.machine)
+
+    finally:
+        for exporter in exporters:
+            exporter.stop()
+        if table.journal is not None:
+            table.journal.close()
@@ -1,10 +1,12 @@
-import time
+import sys
 import logging
 import serial
 
-from transitions_gui import WebMachine
-
-from utils import write_read
+from compiled_machine import CompiledMachine
+from metrics import instrument, export_from_env
+from serial_stats import link_stats
+from transition_journal import TransitionJournal, journal_path
+from utils import make_machine, stop_gui, write_read, run_actions
 
 
 class TablePumpStateMachine:
@@ -53,20 +55,42 @@ class TablePumpStateMachine:
         },
     ]
 
-    def __init__(self):
-        self.ser = serial.Serial(port="COM8", baudrate=9600, timeout=0.1)
-
-        # Initialize the state machine with shared state
-        self.machine = WebMachine(
-            model=self,
-            states=TablePumpStateMachine.states,
-            transitions=TablePumpStateMachine.transitions,
-            initial="Empty_Empty",
-            name="Rotational Table Pump",
-            ignore_invalid_triggers=True,
-            auto_transitions=False,
-            port=8083,
-        )
+    def __init__(
+        self,
+        port="COM8",
+        command_timeout=30.0,
+        gui_port=8083,
+        compiled=False,
+        gui=None,
+        journal=None,
+        max_resume_age=None,
+    ):
+        self.ser = serial.Serial(port=port, baudrate=9600, timeout=0.1)
+        self.command_timeout = command_timeout  # Give up on a silent Arduino
+
+        if compiled:
+            # Integer transition table for high-rate simulation and replay, no GUI
+            self.machine = CompiledMachine(
+                model=self,
+                states=TablePumpStateMachine.states,
+                transitions=TablePumpStateMachine.transitions,
+                initial="Empty_Empty",
+                name="Rotational Table Pump",
+                ignore_invalid_triggers=True,
+            )
+        else:
+            # Initialize the state machine with shared state
+            self.machine = make_machine(
+                model=self,
+                states=TablePumpStateMachine.states,
+                transitions=TablePumpStateMachine.transitions,
+                initial="Empty_Empty",
+                name="Rotational Table Pump",
+                ignore_invalid_triggers=True,
+                auto_transitions=False,
+                port=gui_port,
+                gui=gui,
+            )
 
         # Map states to corresponding transitions
         self.state_action_map = {
@@ -78,12 +102,44 @@ class TablePumpStateMachine:
             "BottleFull_Empty": self.Tray_to_pump,
         }
 
+        # Resume where the journal left off, skipping homing if the table
+        # cannot have moved since (see TransitionJournal.recover)
+        self.journal = None
+        resume = False
+        if journal is not None:
+            self.journal = TransitionJournal(journal)
+            recovery = self.journal.recover(
+                TablePumpStateMachine.states, max_age=max_resume_age
+            )
+            if recovery.state is not None:
+                self.machine.set_state(recovery.state)
+                logging.info(f"Recovered state {recovery.state} from {journal}")
+            resume = recovery.safe
+            if not resume:
+                logging.info(f"Not resuming without homing: {recovery.reason}")
+            self.journal.attach(self.machine)
+
+        # Per-trigger latency and per-state dwell histograms (see metrics)
+        self.metrics = instrument(self)
+
         # Initialization
+        if resume:
+            logging.info("Skipping homing, the table has not moved since the last run")
+        else:
+            self.home()
+
+    def home(self):
         logging.info("Homing the table")
 
-        value = write_read(self.ser, "a")
+        if self.journal is not None:
+            self.journal.command("a", self.state, homing=True)
+        value = write_read(self.ser, "a", timeout=self.command_timeout)
         if value:
             logging.info(value)
+            if self.journal is not None:
+                self.journal.homed(self.state)
+        else:
+            logging.error("No reply to homing command")
 
     # Send command to gantry to implement Tray_to_pump
     def Tray_to_pump(self):
@@ -94,10 +150,15 @@ class TablePumpStateMachine:
     def Rotate(self):
         logging.info("Rotating table")
 
-        value = write_read(self.ser, "5")
+        # Until the transition is journaled, a restart has to home the table
+        if self.journal is not None:
+            self.journal.command("5", self.state)
+        value = write_read(self.ser, "5", timeout=self.command_timeout)
         if value:
             logging.info(value)
             self.trigger("Rotate")
+        else:
+            logging.error("No reply to rotate command")
 
     # Send command to pump and gantry to simutaneously implement FillBottle_And_Tray_to_pump
     def FillBottle_And_Tray_to_pump(self):
@@ -112,28 +173,32 @@ class TablePumpStateMachine:
         logging.info("Stopping the process")
         self.trigger("stop")
 
-    def auto_run(self):
+    def auto_run(self, min_dwell=0.0, max_cycles=None, stop=None):
         """
-        Automatically transitions through the states with a time delay.
-        """
-        while True:
-            logging.info(f"Current state: {self.state}")
-            action = self.state_action_map.get(self.state)
-
-            if action:
-                action()  # Call the action associated with the current state
-            else:
-                logging.error(f"No action defined for state: {self.state}")
+        Automatically transitions through the states as soon as each action finishes.
 
-            time.sleep(1)  # Delay between state transitions
+        Returns the achieved cycle times, one per bottle.
+        """
+        return run_actions(
+            self,
+            cycle_state="BottleFull_BottleEmpty",
+            min_dwell=min_dwell,
+            max_cycles=max_cycles,
+            stop=stop,
+        )
 
 
 if __name__ == "__main__":
     # Setup logging
     logging.basicConfig(level=logging.INFO)
 
-    # Create the table state machine
-    table = TablePumpStateMachine()
+    # Create the table state machine, optionally on another port (e.g. arduino_sim)
+    # With STATE_MACHINES_JOURNAL set, a restart resumes from the table's journal in there
+    table = TablePumpStateMachine(
+        port=sys.argv[1] if len(sys.argv) > 1 else "COM8",
+        journal=journal_path("table_pump"),
+    )
+    exporters = export_from_env()
 
     try:
         # Start automatic state transitions
@@ -141,4 +206,19 @@ if __name__ == "__main__":
 
     except KeyboardInterrupt:
         logging.info("Stopping the server...")
-        table.machine.stop_server()
+        stop_gui(table.machine)
+
+    finally:
+        for exporter in exporters:
+            exporter.stop()
+        if table.journal is not None:
+            table.journal.close()
+
+        # Where the cycle time goes on the serial link, per command
+        for cmd, stats in link_stats(table.ser.port).summary()["commands"].items():
+            logging.info(
+                f"Command {cmd!r}: {stats['count']} replies, {stats['timeouts']} timeouts, "
+                f"round trip p50 {stats['round_trip']['p50'] * 1000:.1f} ms / "
+                f"max {stats['round_trip']['max'] * 1000:.1f} ms, "
+                f"{stats['wire_share']:.0%} of it on the wire"
+            )
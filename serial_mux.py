@@ -0,0 +1,105 @@
+import sys
+import asyncio
+import logging
+
+from serial_transport import SerialTransport
+
+
+class SerialMultiplexer(SerialTransport):
+    """
+    Serial transport that keeps several commands in flight on one link.
+
+    Every command is framed as "#<seq>:<cmd>\\n" and the firmware answers with
+    "#<seq>:<reply>", so replies may come back in any order and are routed to
+    the caller that issued that sequence ID. Lines without a known tag are
+    logged as unsolicited messages.
+    """
+
+    def __init__(self, port, max_in_flight=8, max_seq=999, **kwargs):
+        super().__init__(port, **kwargs)
+        self.max_in_flight = max_in_flight  # Bounded by the Arduino's 64 byte RX buffer
+        self.max_seq = max_seq
+
+        self._pending = {}
+        self._next_seq = 1
+        self._slots = None
+
+    async def open(self):
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        return await super().open()
+
+    async def send_command(self, cmd, deadline=None, timeout=None):
+        async with self._slots:
+            return await super().send_command(cmd, deadline=deadline, timeout=timeout)
+
+    def channel(self, name, prefix=""):
+        # Handle for one device (pump, rotation motor, gantry) sharing this link
+        return DeviceChannel(self, name, prefix)
+
+    def _track(self, future):
+        # Skip sequence IDs that are still waiting for a reply
+        while self._next_seq in self._pending:
+            self._next_seq = self._next_seq % self.max_seq + 1
+        seq = self._next_seq
+        self._next_seq = self._next_seq % self.max_seq + 1
+
+        self._pending[seq] = future
+        return seq
+
+    def _abandon(self, tag, future):
+        # A late reply will carry an unknown tag and be dropped
+        self._pending.pop(tag, None)
+        future.cancel()
+
+    def _frame(self, cmd, tag):
+        # The leading "#" keeps tags apart from plain one-digit commands like "5"
+        return bytes(f"#{tag}:{cmd}\n", self.encoding)
+
+    def _outstanding(self):
+        return list(self._pending.values())
+
+    def _handle_line(self, line):
+        tag, sep, payload = line[1:].partition(":")
+        if line.startswith("#") and sep and tag.isdigit():
+            future = self._pending.pop(int(tag), None)
+            if future is not None and not future.done():
+                future.set_result(payload)
+            else:
+                self.stats.unmatched += 1
+                logging.warning(f"{self.port}: discarding reply with stale tag {line!r}")
+            return
+        self.stats.unmatched += 1
+        logging.info(f"{self.port}: unsolicited message {line!r}")
+
+
+class DeviceChannel:
+    def __init__(self, mux, name, prefix=""):
+        self.mux = mux
+        self.name = name
+        self.prefix = prefix  # Device address understood by the firmware
+
+    async def send_command(self, cmd, deadline=None, timeout=None):
+        reply = await self.mux.send_command(
+            self.prefix + cmd, deadline=deadline, timeout=timeout
+        )
+        logging.debug(f"{self.name}: {cmd!r} -> {reply!r}")
+        return reply
+
+
+async def _demo(port):
+    async with SerialMultiplexer(port) as mux:
+        pump = mux.channel("pump")
+        motor = mux.channel("motor")
+
+        # Both commands are in flight at once instead of waiting on each other
+        replies = await asyncio.gather(
+            motor.send_command("a"), pump.send_command("5"), return_exceptions=True
+        )
+        logging.info(replies)
+
+
+if __name__ == "__main__":
+    # Setup logging
+    logging.basicConfig(level=logging.INFO)
+
+    asyncio.run(_demo(sys.argv[1] if len(sys.argv) > 1 else "COM8"))
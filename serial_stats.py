@@ -0,0 +1,155 @@
+import threading
+
+from metrics import REGISTRY, Histogram, labels, summary_lines
+
+# Start bit, 8 data bits and a stop bit per byte (8N1)
+BITS_PER_BYTE = 10
+
+
+class CommandStats:
+    __slots__ = (
+        "count",
+        "timeouts",
+        "empty_reads",
+        "bytes_out",
+        "bytes_in",
+        "timeout_bytes_out",
+        "timeout_bytes_in",
+        "round_trip",
+    )
+
+    def __init__(self):
+        self.count = 0  # Commands that got a reply
+        self.timeouts = 0
+        self.empty_reads = 0  # readline() calls that timed out without a line
+        # Bytes of commands that got a reply, the ones their round trips cover
+        self.bytes_out = 0
+        self.bytes_in = 0
+        # Bytes of commands that timed out
+        self.timeout_bytes_out = 0
+        self.timeout_bytes_in = 0
+        self.round_trip = Histogram()
+
+
+class SerialStats:
+    """
+    Accounting for one serial link, cheap enough to stay on.
+
+    Per command (the string sent, e.g. "a" or "5"): a round-trip histogram
+    from the write to the reply line, timeouts, empty readline() spins and
+    the bytes it put on the wire in both directions, with the bytes of
+    answered and of timed-out commands kept apart. The time the answered
+    ones need at `baudrate` is the part of the round trip the link itself
+    costs; the rest is the firmware (and the OS) getting to the reply, see
+    summary()'s wire_share. Recording a command costs a dict lookup and a
+    histogram update, next to at least a millisecond per byte at 9600 baud.
+    """
+
+    def __init__(self, port, baudrate=9600):
+        self.port = port
+        self.baudrate = baudrate
+        self.commands = {}
+        self.unmatched = 0  # Late, stale or unsolicited lines
+
+    def command(self, cmd):
+        stats = self.commands.get(cmd)
+        if stats is None:
+            stats = self.commands[cmd] = CommandStats()
+        return stats
+
+    def record(self, cmd, round_trip, bytes_out, bytes_in, empty_reads=0):
+        # `round_trip` in nanoseconds
+        stats = self.command(cmd)
+        stats.count += 1
+        stats.round_trip.record(round_trip)
+        stats.bytes_out += bytes_out
+        stats.bytes_in += bytes_in
+        stats.empty_reads += empty_reads
+
+    def record_timeout(self, cmd, bytes_out, bytes_in=0, empty_reads=0):
+        stats = self.command(cmd)
+        stats.timeouts += 1
+        stats.timeout_bytes_out += bytes_out
+        stats.timeout_bytes_in += bytes_in
+        stats.empty_reads += empty_reads
+
+    def wire_time(self, n_bytes):
+        return n_bytes * BITS_PER_BYTE / self.baudrate
+
+    def summary(self):
+        commands = {}
+        for cmd, stats in list(self.commands.items()):
+            round_trips = stats.round_trip.total / 1e9
+            wire = self.wire_time(stats.bytes_out + stats.bytes_in)
+            commands[cmd] = {
+                "count": stats.count,
+                "timeouts": stats.timeouts,
+                "empty_reads": stats.empty_reads,
+                "bytes_out": stats.bytes_out,
+                "bytes_in": stats.bytes_in,
+                "timeout_bytes_out": stats.timeout_bytes_out,
+                "timeout_bytes_in": stats.timeout_bytes_in,
+                "round_trip": {
+                    name: value / 1e9 if name != "count" else value
+                    for name, value in stats.round_trip.summary().items()
+                },
+                # Share of the round trips spent shifting their bytes at the baud rate
+                "wire_share": wire / round_trips if round_trips else 0.0,
+            }
+        return {
+            "port": self.port,
+            "baudrate": self.baudrate,
+            "unmatched": self.unmatched,
+            "commands": commands,
+        }
+
+    def metric_families(self):
+        families = {
+            ("serial_round_trip_seconds", "summary"): [],
+            ("serial_timeouts_total", "counter"): [],
+            ("serial_empty_reads_total", "counter"): [],
+            ("serial_bytes_total", "counter"): [],
+            ("serial_wire_seconds_total", "counter"): [],
+            ("serial_unmatched_lines_total", "counter"): [],
+        }
+        for cmd, stats in list(self.commands.items()):
+            label_text = labels(port=self.port, command=cmd)
+            if stats.round_trip.count:
+                families[("serial_round_trip_seconds", "summary")] += summary_lines(
+                    "serial_round_trip_seconds", label_text, stats.round_trip
+                )
+            families[("serial_timeouts_total", "counter")].append(
+                f"serial_timeouts_total{{{label_text}}} {stats.timeouts}"
+            )
+            families[("serial_empty_reads_total", "counter")].append(
+                f"serial_empty_reads_total{{{label_text}}} {stats.empty_reads}"
+            )
+            families[("serial_bytes_total", "counter")] += [
+                f'serial_bytes_total{{{label_text},direction="out",outcome="reply"}} {stats.bytes_out}',
+                f'serial_bytes_total{{{label_text},direction="in",outcome="reply"}} {stats.bytes_in}',
+                f'serial_bytes_total{{{label_text},direction="out",outcome="timeout"}} '
+                f"{stats.timeout_bytes_out}",
+                f'serial_bytes_total{{{label_text},direction="in",outcome="timeout"}} '
+                f"{stats.timeout_bytes_in}",
+            ]
+            # Replies only, comparable with serial_round_trip_seconds_sum
+            wire = self.wire_time(stats.bytes_out + stats.bytes_in)
+            families[("serial_wire_seconds_total", "counter")].append(
+                f"serial_wire_seconds_total{{{label_text}}} {wire:.6f}"
+            )
+        families[("serial_unmatched_lines_total", "counter")].append(
+            f"serial_unmatched_lines_total{{{labels(port=self.port)}}} {self.unmatched}"
+        )
+        return families
+
+
+_links = {}
+_links_lock = threading.Lock()
+
+
+def link_stats(port, baudrate=9600, registry=REGISTRY):
+    # One SerialStats per port and process, exported with the machines' metrics
+    with _links_lock:
+        if port not in _links:
+            _links[port] = registry.add_source(SerialStats(port, baudrate))
+        return _links[port]
@@ -0,0 +1,199 @@
+import sys
+import time
+import asyncio
+import logging
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+
+from serial_stats import link_stats
+
+
+class SerialTransport:
+    """
+    Asynchronous line-based transport for one Arduino serial port.
+
+    A single reader task per port pulls lines off the wire and hands them to the
+    oldest outstanding command, so awaiting a reply never blocks the event loop
+    and several ports can be driven from one process.
+    """
+
+    def __init__(
+        self,
+        port,
+        baudrate=9600,
+        timeout=30.0,
+        read_timeout=0.1,
+        encoding="utf-8",
+        ser=None,
+    ):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout  # Default time to wait for a reply (seconds)
+        self.read_timeout = read_timeout  # Timeout of a single readline()
+        self.encoding = encoding
+        self.stats = link_stats(port, baudrate)
+
+        self.ser = ser
+        self._pending = collections.deque()
+        self._write_lock = None
+        self._reader_task = None
+        self._loop = None
+
+        # Dedicated reader/writer threads per port so a slow readline() never starves
+        # other ports or the event loop
+        self._executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix=f"serial-{port}"
+        )
+
+    async def open(self):
+        self._loop = asyncio.get_running_loop()
+        self._write_lock = asyncio.Lock()
+
+        if self.ser is None:
+            self.ser = await self._loop.run_in_executor(
+                self._executor,
+                lambda: serial.Serial(
+                    port=self.port, baudrate=self.baudrate, timeout=self.read_timeout
+                ),
+            )
+
+        self._reader_task = asyncio.create_task(
+            self._read_loop(), name=f"serial-reader-{self.port}"
+        )
+        logging.info(f"Serial transport opened on {self.port}")
+        return self
+
+    async def close(self):
+        if self._reader_task:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+            self._reader_task = None
+
+        # Fail every command that is still waiting for a reply
+        for future in self._outstanding():
+            if not future.done():
+                future.set_exception(ConnectionError(f"{self.port} closed"))
+        self._pending.clear()
+
+        if self.ser is not None:
+            self.ser.close()
+        self._executor.shutdown(wait=False)
+        logging.info(f"Serial transport closed on {self.port}")
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def send_command(self, cmd, deadline=None, timeout=None):
+        """
+        Send a command and wait for its reply line.
+
+        `deadline` is an absolute time on the event loop clock (loop.time()),
+        `timeout` is relative to now; the earlier of the two wins. Raises
+        TimeoutError if no reply arrives in time.
+        """
+        if self._reader_task is None:
+            raise ConnectionError(f"{self.port} is not open")
+
+        loop = self._loop
+        if timeout is None and deadline is None:
+            timeout = self.timeout
+        if timeout is not None:
+            limit = loop.time() + timeout
+            deadline = limit if deadline is None else min(deadline, limit)
+
+        future = loop.create_future()
+
+        # Writes and the pending queue must stay in the same order
+        async with self._write_lock:
+            tag = self._track(future)
+            frame = self._frame(cmd, tag)
+            started = time.perf_counter_ns()
+            await self._write(frame)
+
+        try:
+            reply = await asyncio.wait_for(
+                asyncio.shield(future), max(0.0, deadline - loop.time())
+            )
+            # Reply bytes are the line plus CRLF, a multiplexer's tag is not counted
+            self.stats.record(
+                cmd, time.perf_counter_ns() - started, len(frame), len(reply) + 2
+            )
+            return reply
+        except asyncio.TimeoutError:
+            self.stats.record_timeout(cmd, len(frame))
+            self._abandon(tag, future)
+            raise TimeoutError(
+                f"No reply to {cmd!r} from {self.port} before the deadline"
+            ) from None
+
+    async def _write(self, data):
+        await self._loop.run_in_executor(self._executor, self.ser.write, data)
+
+    def _track(self, future):
+        self._pending.append(future)
+        return None
+
+    def _abandon(self, tag, future):
+        # Leave the future queued: a late reply still belongs to this command
+        # and must be discarded rather than handed to the next caller
+        future.cancel()
+
+    def _frame(self, cmd, tag):
+        return bytes(cmd, self.encoding)
+
+    async def _read_loop(self):
+        while True:
+            raw = await self._loop.run_in_executor(self._executor, self.ser.readline)
+            line = raw.decode(self.encoding, errors="replace").strip()
+            if line:
+                self._handle_line(line)
+
+    def _outstanding(self):
+        return list(self._pending)
+
+    def _handle_line(self, line):
+        # Replies are untagged, so they are matched to commands in order
+        while self._pending:
+            future = self._pending.popleft()
+            if not future.done():
+                future.set_result(line)
+                return
+            if future.cancelled():
+                self.stats.unmatched += 1
+                logging.warning(f"{self.port}: discarding late reply {line!r}")
+                return
+        self.stats.unmatched += 1
+        logging.info(f"{self.port}: unsolicited message {line!r}")
+
+
+async def _demo(ports):
+    transports = [SerialTransport(port) for port in ports]
+    for transport in transports:
+        await transport.open()
+
+    try:
+        # Home every table at once
+        replies = await asyncio.gather(
+            *(transport.send_command("a") for transport in transports),
+            return_exceptions=True,
+        )
+        for transport, reply in zip(transports, replies):
+            logging.info(f"{transport.port}: {reply}")
+    finally:
+        for transport in transports:
+            await transport.close()
+
+
+if __name__ == "__main__":
+    # Setup logging
+    logging.basicConfig(level=logging.INFO)
+
+    asyncio.run(_demo(sys.argv[1:] or ["COM8"]))
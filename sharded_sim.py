@@ -0,0 +1,229 @@
+import time
+import queue
+import random
+import logging
+import argparse
+from multiprocessing import Process, Barrier, Queue, shared_memory
+
+import numpy as np
+
+from traffic_light import TrafficLight
+from car import Vehicle, VEHICLES
+
+
+class StateTable:
+    """
+    Light and vehicle states of the whole simulation as two uint8 arrays
+    (indices into TrafficLight.states / Vehicle.states) in one shared memory
+    segment, so every shard can see every light.
+    """
+
+    def __init__(self, n_lights, n_vehicles, name=None, create=False):
+        self.n_lights = n_lights
+        self.n_vehicles = n_vehicles
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=create, size=max(1, n_lights + n_vehicles)
+        )
+        self.name = self.shm.name
+        self.lights = np.ndarray((n_lights,), dtype=np.uint8, buffer=self.shm.buf)
+        self.vehicles = np.ndarray(
+            (n_vehicles,), dtype=np.uint8, buffer=self.shm.buf, offset=n_lights
+        )
+        if create:
+            self.lights[:] = 0
+            self.vehicles[:] = 0
+
+    def __reduce__(self):
+        # Other processes attach by name
+        return (StateTable, (self.n_lights, self.n_vehicles, self.name, False))
+
+    def close(self):
+        # The arrays must let go of the buffer before the segment can be closed
+        del self.lights, self.vehicles
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def split(count, shards):
+    # Contiguous, nearly equal slices, one per shard
+    bounds = [count * shard // shards for shard in range(shards + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def run_shard(shard, table, barrier, lights, vehicles, offsets, rounds, period, results):
+    """
+    Steps one shard's lights and vehicles in lockstep with the other shards.
+
+    Every round has two phases separated by barriers: the lights whose timer
+    ran out fire timeup and publish their state to the table, then every
+    vehicle reacts to the light at its intersection, which may belong to any
+    shard.
+    """
+    try:
+        light_start, light_stop = lights
+        vehicle_start, vehicle_stop = vehicles
+
+        light_models = [TrafficLight() for _ in range(light_start, light_stop)]
+        light_index = {state: i for i, state in enumerate(TrafficLight.states)}
+        vehicle_models = VEHICLES.create(vehicle_stop - vehicle_start)
+        vehicle_index = {state: i for i, state in enumerate(Vehicle.states)}
+        # Vehicle i waits at light i % n_lights
+        intersections = [i % table.n_lights for i in range(vehicle_start, vehicle_stop)]
+
+        light_transitions = 0
+        vehicle_transitions = 0
+        busy = 0.0
+
+        # Start the clock together, once every shard is set up
+        barrier.wait()
+        started = time.perf_counter()
+
+        for step in range(rounds):
+            phase_started = time.perf_counter()
+            for light, offset in zip(light_models, offsets):
+                if (step + offset) % period == 0:
+                    light.timeup()
+                    light_transitions += 1
+            table.lights[light_start:light_stop] = [
+                light_index[light.state] for light in light_models
+            ]
+            busy += time.perf_counter() - phase_started
+            barrier.wait()
+
+            phase_started = time.perf_counter()
+            light_states = [TrafficLight.states[i] for i in table.lights.tolist()]
+            for vehicle, intersection in zip(vehicle_models, intersections):
+                before = vehicle.state
+                vehicle.handle_traffic_light(light_states[intersection])
+                if vehicle.state != before:
+                    vehicle_transitions += 1
+            table.vehicles[vehicle_start:vehicle_stop] = [
+                vehicle_index[vehicle.state] for vehicle in vehicle_models
+            ]
+            busy += time.perf_counter() - phase_started
+            barrier.wait()
+
+        results.put(
+            {
+                "shard": shard,
+                "lights": len(light_models),
+                "vehicles": len(vehicle_models),
+                "light_transitions": light_transitions,
+                "vehicle_transitions": vehicle_transitions,
+                "busy": busy,
+                "elapsed": time.perf_counter() - started,
+            }
+        )
+        VEHICLES.remove_model(vehicle_models)
+    except BaseException:
+        # Release the other shards instead of leaving them stuck at the barrier
+        barrier.abort()
+        raise
+    finally:
+        table.close()
+
+
+def run(n_lights=2000, n_vehicles=20000, shards=4, rounds=200, period=20, seed=1):
+    """
+    Runs the sharded simulation and returns its totals and per-shard stats.
+
+    `elapsed` is the slowest shard's time for the rounds, from a common start
+    after every shard is set up, so process start-up is not counted.
+    """
+    if n_lights < 1:
+        raise ValueError(f"Need at least one light, got {n_lights}")
+    if shards < 1:
+        raise ValueError(f"Need at least one shard, got {shards}")
+    if period < 1:
+        raise ValueError(f"The period must be at least one round, got {period}")
+
+    # Random phase per light, independent of the number of shards
+    rng = random.Random(seed)
+    offsets = [rng.randrange(period) for _ in range(n_lights)]
+
+    table = StateTable(n_lights, n_vehicles, create=True)
+    barrier = Barrier(shards)
+    results = Queue()
+
+    light_slices = split(n_lights, shards)
+    vehicle_slices = split(n_vehicles, shards)
+    processes = [
+        Process(
+            target=run_shard,
+            args=(
+                shard,
+                table,
+                barrier,
+                light_slices[shard],
+                vehicle_slices[shard],
+                offsets[slice(*light_slices[shard])],
+                rounds,
+                period,
+                results,
+            ),
+        )
+        for shard in range(shards)
+    ]
+
+    try:
+        for process in processes:
+            process.start()
+
+        shard_stats = []
+        while len(shard_stats) < shards:
+            if any(p.exitcode not in (None, 0) for p in processes):
+                raise RuntimeError("A shard failed, see its traceback above")
+            try:
+                shard_stats.append(results.get(timeout=0.5))
+            except queue.Empty:
+                continue  # Keep watching the shards
+        elapsed = max(s["elapsed"] for s in shard_stats)
+
+        for process in processes:
+            process.join()
+
+        return {
+            "shards": shards,
+            "rounds": rounds,
+            "elapsed": elapsed,
+            "rounds_per_second": rounds / elapsed,
+            "light_transitions": sum(s["light_transitions"] for s in shard_stats),
+            "vehicle_transitions": sum(s["vehicle_transitions"] for s in shard_stats),
+            "moving": int(np.count_nonzero(table.vehicles == Vehicle.states.index("moving"))),
+            "shard_stats": sorted(shard_stats, key=lambda s: s["shard"]),
+        }
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        table.close()
+        table.unlink()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded traffic light / vehicle simulation")
+    parser.add_argument("--lights", type=int, default=2000)
+    parser.add_argument("--vehicles", type=int, default=20000)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--period", type=int, default=20, help="Rounds between two timeups of a light")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    # Setup logging
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("transitions").setLevel(logging.WARNING)
+
+    result = run(args.lights, args.vehicles, args.shards, args.rounds, args.period, args.seed)
+    logging.info(
+        f"{result['shards']} shards: {result['rounds_per_second']:.1f} rounds/s, "
+        f"{result['light_transitions']} light and {result['vehicle_transitions']} vehicle "
+        f"transitions, {result['moving']} vehicles moving at the end"
+    )
+    for stats in result["shard_stats"]:
+        logging.info(
+            f"Shard {stats['shard']}: {stats['lights']} lights, {stats['vehicles']} vehicles, "
+            f"busy {stats['busy'] / stats['elapsed']:.0%} of the time"
+        )
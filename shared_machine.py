@@ -0,0 +1,88 @@
+from collections import deque
+
+from transitions import Machine
+from transitions.core import listify
+
+
+class SharedMachine(Machine):
+    """
+    One Machine serving many instances of a lightweight model class.
+
+    A Machine per model copies the states and transitions and binds one
+    partial per trigger and state onto every instance. Here the model class
+    can use __slots__ (only the `state` slot is needed): the trigger methods,
+    `trigger()` and `is_<state>()` are bound once on the class and look up the
+    shared events at call time. Adding models skips transitions' per-model
+    binding and its linear `model in self.models` check, so registering tens
+    of thousands of models stays linear.
+
+    The definition is fixed once the machine is built: transitions added later
+    are not bound to the class. Auto transitions are off by default.
+    """
+
+    def __init__(self, model_class, *args, **kwargs):
+        kwargs.setdefault("auto_transitions", False)
+        self.model_class = model_class
+        super().__init__(None, *args, **kwargs)
+        self._bind_class(model_class)
+
+    def _bind_class(self, cls):
+        machine = self
+
+        def trigger(model, name, *args, **kwargs):
+            return machine.events[name].trigger(model, *args, **kwargs)
+
+        if not hasattr(cls, "trigger"):
+            cls.trigger = trigger
+
+        for name, event in self.events.items():
+            if not hasattr(cls, name):
+                setattr(cls, name, self._trigger_method(event))
+
+        for state in self.states.values():
+            if not hasattr(cls, "is_" + state.name):
+                setattr(cls, "is_" + state.name, self._is_state_method(state.value))
+
+    @staticmethod
+    def _trigger_method(event):
+        def fire(model, *args, **kwargs):
+            return event.trigger(model, *args, **kwargs)
+
+        fire.__name__ = event.name
+        return fire
+
+    def _is_state_method(self, value):
+        attribute = self.model_attribute
+        return lambda model: getattr(model, attribute) == value
+
+    def add_model(self, model, initial=None):
+        models = listify(model)
+        value = self.get_state(self.initial if initial is None else initial).value
+        for mod in models:
+            setattr(mod, self.model_attribute, value)
+        self.models.extend(models)
+
+    def create(self, count, initial=None):
+        """
+        Creates and registers `count` models of the model class.
+        """
+        models = [self.model_class() for _ in range(count)]
+        self.add_model(models, initial)
+        return models
+
+    def remove_model(self, model):
+        """
+        Unregisters models so they can be freed, e.g. a population that is done.
+
+        The machine holds every model it created until then. One pass over
+        the registered models removes any number of them, where transitions
+        does a list.remove() per model.
+        """
+        removed = {id(mod) for mod in listify(model)}
+        self.models[:] = [mod for mod in self.models if id(mod) not in removed]
+        if len(self._transition_queue) > 0:
+            # Like transitions: the first event is being processed, drop the removed models' others
+            queued = list(self._transition_queue)
+            self._transition_queue = deque(
+                queued[:1] + [e for e in queued[1:] if id(e.args[0].model) not in removed]
+            )
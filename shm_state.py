@@ -0,0 +1,278 @@
+import os
+import time
+import select
+import socket
+import struct
+import itertools
+import tempfile
+from multiprocessing import shared_memory
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+MAGIC = b"SMST"
+VERSION = 2
+
+# magic, version, number of states | sequence | state index | timestamp |
+# subscriber generation
+HEADER = struct.Struct("<4sHH")
+SEQ = struct.Struct("<Q")
+SLOT = struct.Struct("<i4xd")
+GENERATION = struct.Struct("<Q")
+
+SEQ_OFFSET = 8
+SLOT_OFFSET = 16
+GENERATION_OFFSET = 32
+NAMES_OFFSET = 40
+
+# Without Unix sockets (Windows) subscribers fall back to polling the sequence
+HAS_UNIX_SOCKETS = hasattr(socket, "AF_UNIX") and fcntl is not None
+POLL_INTERVAL = 0.01
+
+_subscription_ids = itertools.count()
+
+
+def notify_dir(name):
+    # Every subscriber of a slot binds one datagram socket in here
+    return os.path.join(tempfile.gettempdir(), f"{name}.notify")
+
+
+class SharedStateSlot:
+    """
+    Machine state published through shared memory as a typed seqlock slot.
+
+    The segment holds the state as an integer index plus a timestamp, guarded
+    by a sequence counter: the writer makes it odd while writing and even when
+    done, and readers retry until they see the same even value before and after
+    copying, so a half-written state is never returned. The state names are
+    stored once after the header, so readers need no copy of the machine
+    definition. Writers in several processes must share a `lock`.
+
+    The slot also works as a drop-in for a Manager().Value("s", ...) proxy:
+    `value` reads and writes the state name without a round trip to the
+    Manager server. With create=True and no name a unique name is generated.
+    """
+
+    def __init__(self, name=None, states=None, create=False, lock=None):
+        if create:
+            names = b"\0".join(state.encode("utf-8") for state in states)
+            self.shm = shared_memory.SharedMemory(
+                name=name, create=True, size=NAMES_OFFSET + len(names)
+            )
+            HEADER.pack_into(self.shm.buf, 0, MAGIC, VERSION, len(states))
+            SEQ.pack_into(self.shm.buf, SEQ_OFFSET, 0)
+            SLOT.pack_into(self.shm.buf, SLOT_OFFSET, -1, 0.0)
+            GENERATION.pack_into(self.shm.buf, GENERATION_OFFSET, 0)
+            self.shm.buf[NAMES_OFFSET : NAMES_OFFSET + len(names)] = names
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        magic, version, n_states = HEADER.unpack_from(self.shm.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{name} is not a version {VERSION} state slot")
+
+        names = bytes(self.shm.buf[NAMES_OFFSET:]).rstrip(b"\0")
+        self.states = [state.decode("utf-8") for state in names.split(b"\0")][:n_states]
+        self.state_index = {state: i for i, state in enumerate(self.states)}
+
+        self.name = self.shm.name
+        self.created = create
+        self.lock = lock
+
+        self._notify_dir = notify_dir(self.name)
+        self._generation = None
+        self._subscribers = []
+        self._sender = None
+        if HAS_UNIX_SOCKETS:
+            if create:
+                os.makedirs(self._notify_dir, exist_ok=True)
+            self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sender.setblocking(False)
+
+    def __reduce__(self):
+        # Other processes attach by name
+        return (SharedStateSlot, (self.name, None, False, self.lock))
+
+    @property
+    def value(self):
+        return self.read_state()
+
+    @value.setter
+    def value(self, state):
+        self.publish(state)
+
+    def publish(self, state):
+        if self.lock is None:
+            self._publish(state)
+        else:
+            with self.lock:
+                self._publish(state)
+
+    def _publish(self, state):
+        buf = self.shm.buf
+        seq = SEQ.unpack_from(buf, SEQ_OFFSET)[0]
+        SEQ.pack_into(buf, SEQ_OFFSET, seq + 1)  # Odd: write in progress
+        SLOT.pack_into(buf, SLOT_OFFSET, self.state_index[state], time.time())
+        SEQ.pack_into(buf, SEQ_OFFSET, seq + 2)
+        self.notify()
+
+    def notify(self):
+        """
+        Wakes every subscriber blocked in StateSubscription.wait().
+        """
+        if self._sender is None:
+            return
+
+        # Rescan the subscriber sockets only when one came or went; subscribers
+        # bump the generation after binding, so a new socket is always seen
+        generation = GENERATION.unpack_from(self.shm.buf, GENERATION_OFFSET)[0]
+        if generation != self._generation:
+            try:
+                self._subscribers = [entry.path for entry in os.scandir(self._notify_dir)]
+            except FileNotFoundError:
+                return
+            self._generation = generation
+
+        for path in self._subscribers:
+            try:
+                self._sender.sendto(b"\x01", path)
+            except BlockingIOError:
+                pass  # A wake-up is already pending for this subscriber
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The subscriber died without cleaning up
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    def subscribe(self):
+        return StateSubscription(self)
+
+    def _subscribers_changed(self):
+        # Under a lock on the notify directory, so subscribers coming or going
+        # in several processes at once never lose an increment
+        fd = os.open(self._notify_dir, os.O_RDONLY)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            generation = GENERATION.unpack_from(self.shm.buf, GENERATION_OFFSET)[0]
+            GENERATION.pack_into(self.shm.buf, GENERATION_OFFSET, generation + 1)
+        finally:
+            os.close(fd)  # Releases the lock
+
+    def read_raw(self):
+        """
+        Returns (sequence, state index, timestamp) without a torn read.
+        """
+        buf = self.shm.buf
+        while True:
+            before = SEQ.unpack_from(buf, SEQ_OFFSET)[0]
+            if before & 1:
+                continue  # Writer is mid-update
+            index, timestamp = SLOT.unpack_from(buf, SLOT_OFFSET)
+            if SEQ.unpack_from(buf, SEQ_OFFSET)[0] == before:
+                return before, index, timestamp
+
+    def read_state(self):
+        # Fast path for the state name alone
+        index = self.read_raw()[1]
+        return self.states[index] if index >= 0 else None
+
+    def read(self):
+        """
+        Returns (sequence, state name, timestamp); the state is None until the
+        first publish.
+        """
+        seq, index, timestamp = self.read_raw()
+        return seq, self.states[index] if index >= 0 else None, timestamp
+
+    def attach(self, machine, model):
+        """
+        Publishes `model`'s state now and after every transition of `machine`.
+        """
+
+        def publish_state(*args, **kwargs):
+            self.publish(model.state)
+
+        machine.after_state_change.append(publish_state)
+        self.publish(model.state)
+        return publish_state
+
+    def close(self):
+        if self._sender is not None:
+            self._sender.close()
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+        if HAS_UNIX_SOCKETS:
+            for entry in os.scandir(self._notify_dir):
+                os.unlink(entry.path)
+            os.rmdir(self._notify_dir)
+
+
+class StateSubscription:
+    """
+    Blocks a consumer until the slot's publisher changes the state.
+
+    Each subscription binds a Unix datagram socket that the publisher pokes
+    after every publish, so a waiting consumer uses no CPU and wakes within
+    milliseconds. On platforms without Unix sockets it polls the sequence
+    counter every POLL_INTERVAL seconds instead.
+    """
+
+    def __init__(self, slot):
+        self.slot = slot
+        self.sock = None
+        self.path = None
+
+        if HAS_UNIX_SOCKETS:
+            self.path = os.path.join(
+                slot._notify_dir, f"{os.getpid()}-{next(_subscription_ids)}.sock"
+            )
+            if os.path.exists(self.path):
+                os.unlink(self.path)  # Left over from a crashed process with our pid
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sock.bind(self.path)
+            self.sock.setblocking(False)
+            slot._subscribers_changed()
+
+    def wait(self, last_seq=None, timeout=None):
+        """
+        Returns (sequence, state, timestamp) as soon as the sequence differs
+        from `last_seq`, or None after `timeout` seconds without a change.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            seq, state, timestamp = self.slot.read()
+            if seq != last_seq:
+                return seq, state, timestamp
+
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+
+            if self.sock is None:
+                time.sleep(POLL_INTERVAL if remaining is None else min(POLL_INTERVAL, remaining))
+                continue
+
+            readable, _, _ = select.select([self.sock], [], [], remaining)
+            if readable:
+                self._drain()
+
+    def _drain(self):
+        try:
+            while True:
+                self.sock.recv(16)
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.slot._subscribers_changed()
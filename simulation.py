@@ -0,0 +1,376 @@
+import heapq
+import random
+import logging
+import itertools
+
+from transitions import Machine
+
+from rotational_table_pump import TablePumpStateMachine
+from rotational_table_measure import TableMeasureStateMachine
+from gantry_SM import GantryStateMachine
+
+
+class SimEvent:
+    """
+    Something a simulated process can wait for by yielding it.
+    """
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.triggered = False
+        self.value = None
+        self._callbacks = []
+
+    def add_callback(self, callback):
+        if self.triggered:
+            self.sim.schedule(0.0, callback, self.value)
+        else:
+            self._callbacks.append(callback)
+
+    def succeed(self, value=None):
+        if self.triggered:
+            return
+        self.triggered = True
+        self.value = value
+        for callback in self._callbacks:
+            self.sim.schedule(0.0, callback, value)
+        self._callbacks.clear()
+
+
+class Simulation:
+    """
+    Discrete-event simulation on a virtual clock.
+
+    Processes are generators: yielding a number waits that many virtual
+    seconds, yielding a SimEvent waits until it succeeds. No wall-clock time
+    passes, so hours of operation are simulated as fast as the events can be
+    processed.
+    """
+
+    def __init__(self, seed=None):
+        self.now = 0.0
+        self.rng = random.Random(seed)
+        self._queue = []
+        self._order = itertools.count()
+
+    def schedule(self, delay, callback, *args):
+        heapq.heappush(self._queue, (self.now + delay, next(self._order), callback, args))
+
+    def event(self):
+        return SimEvent(self)
+
+    def process(self, generator):
+        def step(value=None):
+            try:
+                target = generator.send(value)
+            except StopIteration:
+                return
+            if isinstance(target, SimEvent):
+                target.add_callback(step)
+            else:
+                self.schedule(target, step)
+
+        self.schedule(0.0, step)
+
+    def run(self, until=None):
+        while self._queue:
+            time, _, callback, args = self._queue[0]
+            if until is not None and time > until:
+                break
+            heapq.heappop(self._queue)
+            self.now = time
+            callback(*args)
+        if until is not None:
+            self.now = until
+
+
+class Resource:
+    """
+    Something only one process can use at a time (the gantry), granted by priority.
+    """
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.busy = False
+        self.busy_time = 0.0
+        self._since = 0.0
+        self._waiting = []
+        self._order = itertools.count()
+
+    def request(self, priority=0):
+        granted = self.sim.event()
+        if not self.busy:
+            self._grant(granted)
+        else:
+            heapq.heappush(self._waiting, (-priority, next(self._order), granted))
+        return granted
+
+    def release(self):
+        self.busy = False
+        self.busy_time += self.sim.now - self._since
+        if self._waiting:
+            _, _, granted = heapq.heappop(self._waiting)
+            self._grant(granted)
+
+    def _grant(self, granted):
+        self.busy = True
+        self._since = self.sim.now
+        granted.succeed()
+
+
+class Handoff:
+    """
+    Rendezvous for a bottle passed from the pump table to the measure table.
+    """
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.receiver_ready = sim.event()
+        self.delivered = sim.event()
+
+    def receive(self):
+        # Measure side: announce a free slot and wait for the bottle
+        self.receiver_ready.succeed()
+        return self.delivered
+
+    def deliver(self):
+        # Pump side, once the gantry has moved the bottle
+        delivered = self.delivered
+        self.receiver_ready = self.sim.event()
+        self.delivered = self.sim.event()
+        delivered.succeed()
+
+
+# Duration models, called with the simulation's random generator
+class Constant:
+    def __init__(self, value):
+        self.value = value
+
+    def __call__(self, rng):
+        return self.value
+
+
+class Uniform:
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+
+    def __call__(self, rng):
+        return rng.uniform(self.low, self.high)
+
+
+class Normal:
+    def __init__(self, mean, std):
+        self.mean = mean
+        self.std = std
+
+    def __call__(self, rng):
+        return max(0.0, rng.gauss(self.mean, self.std))
+
+
+class Exponential:
+    def __init__(self, mean):
+        self.mean = mean
+
+    def __call__(self, rng):
+        return rng.expovariate(1.0 / self.mean)
+
+
+# Seconds per action, keyed by station and trigger (gantry: by job)
+DEFAULT_DURATIONS = {
+    "pump": {
+        "Tray_to_pump": Constant(0.0),
+        "Rotate": Normal(3.0, 0.2),
+        "FillBottle_And_Tray_to_pump": Normal(20.0, 2.0),
+        "Pump_to_measure_And_FillBottle": Normal(20.0, 2.0),
+    },
+    "measure": {
+        "Pump_to_measure": Constant(0.0),
+        "Rotate": Normal(3.0, 0.2),
+        "UV_Measure_And_Pump_to_measure": Normal(30.0, 3.0),
+        "Pump_to_measure_And_UV_Measure_And_DLS_Measure": Normal(60.0, 5.0),
+        "Measure_to_tray_And_UV_Measure_And_DLS_Measure": Normal(60.0, 5.0),
+    },
+    "gantry": {
+        "Tray_to_pump": Uniform(4.0, 6.0),
+        "Pump_to_measure": Uniform(4.0, 6.0),
+        "Measure_to_tray": Uniform(4.0, 6.0),
+    },
+}
+
+# Gantry job each table transition needs before it can complete
+PUMP_GANTRY_JOBS = {
+    "Tray_to_pump": "Tray_to_pump",
+    "FillBottle_And_Tray_to_pump": "Tray_to_pump",
+}
+MEASURE_GANTRY_JOBS = {
+    "Measure_to_tray_And_UV_Measure_And_DLS_Measure": "Measure_to_tray",
+}
+
+# Table transitions that take a bottle handed over from the pump table
+PUMP_HANDOFF = "Pump_to_measure_And_FillBottle"
+MEASURE_HANDOFFS = {
+    "Pump_to_measure",
+    "UV_Measure_And_Pump_to_measure",
+    "Pump_to_measure_And_UV_Measure_And_DLS_Measure",
+}
+
+JOB_PRIORITIES = {"Pump_to_measure": 2, "Measure_to_tray": 1, "Tray_to_pump": 0}
+
+
+class Station:
+    """
+    Headless copy of one of the plant's machines with virtual-time bookkeeping.
+    """
+
+    def __init__(self, sim, name, definition, initial):
+        self.sim = sim
+        self.name = name
+        self.machine = Machine(
+            model=self,
+            states=definition.states,
+            transitions=definition.transitions,
+            initial=initial,
+            auto_transitions=False,
+            ignore_invalid_triggers=True,
+        )
+
+        # The rotational tables run a fixed cycle: one trigger per state
+        self.next_trigger = {}
+        for transition in definition.transitions:
+            sources = transition["source"]
+            for source in sources if isinstance(sources, list) else [sources]:
+                self.next_trigger.setdefault(source, transition["trigger"])
+
+        self.dwell = {}  # State -> virtual seconds spent in it
+        self.waiting = {"gantry": 0.0, "handoff": 0.0}
+        self._entered_at = 0.0
+
+    def enter(self, trigger):
+        self.close_dwell()
+        self.trigger(trigger)
+
+    def close_dwell(self):
+        # Book the time since the last state change to the current state
+        self.dwell[self.state] = self.dwell.get(self.state, 0.0) + (
+            self.sim.now - self._entered_at
+        )
+        self._entered_at = self.sim.now
+
+    def wait(self, reason, event):
+        started = self.sim.now
+        yield event
+        self.waiting[reason] += self.sim.now - started
+
+
+class LineSimulation:
+    """
+    The microfluidic line (pump table, measure table, gantry) on a virtual clock.
+
+    Mirrors PlantOrchestrator: both tables run their cycles concurrently,
+    share the gantry by priority and meet to hand bottles over.
+    """
+
+    def __init__(self, durations=None, seed=None):
+        self.sim = Simulation(seed=seed)
+        self.durations = {
+            station: dict(DEFAULT_DURATIONS[station], **(durations or {}).get(station, {}))
+            for station in DEFAULT_DURATIONS
+        }
+
+        self.pump = Station(self.sim, "pump", TablePumpStateMachine, "Empty_Empty")
+        self.measure = Station(
+            self.sim, "measure", TableMeasureStateMachine, "Empty_Empty_Empty"
+        )
+        self.gantry = Station(self.sim, "gantry", GantryStateMachine, "Idle")
+
+        self.gantry_resource = Resource(self.sim)
+        self.handoff = Handoff(self.sim)
+        self.bottles_done = 0
+        self.finish_times = []
+        self.gantry_jobs = 0
+
+    def duration(self, station, trigger):
+        return self.durations[station][trigger](self.sim.rng)
+
+    def move(self, station, job):
+        # Reserve the gantry, carry out the job and release it
+        yield from station.wait(
+            "gantry", self.gantry_resource.request(JOB_PRIORITIES[job])
+        )
+        self.gantry.enter("getRequest_" + job)
+        yield self.duration("gantry", job)
+        self.gantry.enter("finishRequest")
+        self.gantry_resource.release()
+        self.gantry_jobs += 1
+
+    def run_pump(self):
+        pump = self.pump
+        while True:
+            trigger = pump.next_trigger[pump.state]
+            if trigger == PUMP_HANDOFF:
+                yield from pump.wait("handoff", self.handoff.receiver_ready)
+                yield from self.move(pump, "Pump_to_measure")
+                yield self.duration("pump", trigger)
+                pump.enter(trigger)
+                self.handoff.deliver()
+                continue
+
+            if trigger in PUMP_GANTRY_JOBS:
+                yield from self.move(pump, PUMP_GANTRY_JOBS[trigger])
+            yield self.duration("pump", trigger)
+            pump.enter(trigger)
+
+    def run_measure(self):
+        measure = self.measure
+        while True:
+            trigger = measure.next_trigger[measure.state]
+            if trigger in MEASURE_HANDOFFS:
+                yield from measure.wait("handoff", self.handoff.receive())
+            if trigger in MEASURE_GANTRY_JOBS:
+                yield from self.move(measure, MEASURE_GANTRY_JOBS[trigger])
+            yield self.duration("measure", trigger)
+            measure.enter(trigger)
+
+            if trigger in MEASURE_GANTRY_JOBS:
+                self.bottles_done += 1
+                self.finish_times.append(self.sim.now)
+
+    def run(self, hours=8.0):
+        self.sim.process(self.run_pump())
+        self.sim.process(self.run_measure())
+        self.sim.run(until=hours * 3600)
+
+        # Close the dwell time of the states the stations are still in
+        for station in (self.pump, self.measure, self.gantry):
+            station.close_dwell()
+
+        return {
+            "hours": hours,
+            "bottles": self.bottles_done,
+            "bottles_per_hour": self.bottles_done / hours if hours else 0.0,
+            "gantry_utilisation": self.gantry_resource.busy_time / self.sim.now,
+        }
+
+
+def timed_cycle(sim, model, trigger, durations):
+    """
+    Process firing `trigger` on a model after a per-state dwell time, e.g. the
+    traffic light's 'timeup' every 2 s, without sleeping in real time.
+    """
+    while True:
+        yield durations[model.state](sim.rng)
+        model.trigger(trigger)
+
+
+if __name__ == "__main__":
+    # Setup logging
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("transitions").setLevel(logging.WARNING)
+
+    # Simulate one eight-hour shift
+    line = LineSimulation(seed=1)
+    result = line.run(hours=8.0)
+    logging.info(f"Shift result: {result}")
+    logging.info(f"Pump table waits: {line.pump.waiting}")
+    logging.info(f"Measure table waits: {line.measure.waiting}")
@@ -0,0 +1,30 @@
+from graph_layout import LayoutCache, layered_layout, render_svg
+
+
+def test_state_without_neighbours():
+    # red has no transitions at all, its sort key used to look it up in the emptied layer
+    markup = {
+        "initial": "red",
+        "states": ["green", "yellow", "red"],
+        "transitions": [{"trigger": "timeup", "source": "green", "dest": "yellow"}],
+    }
+    svg = render_svg(markup)
+    for state in markup["states"]:
+        assert f'data-state="{state}"' in svg
+
+
+def test_layers_follow_the_flow():
+    positions = layered_layout(["a", "b", "c"], [("a", "b"), ("b", "c"), ("c", "a")], initial="a")
+    assert positions["a"][1] < positions["b"][1] < positions["c"][1]
+
+
+def test_memory_is_bounded(tmp_path):
+    cache = LayoutCache(str(tmp_path), memory_size=2)
+
+    def markup(n):
+        return {"initial": f"s{n}", "states": [f"s{n}", "t"], "transitions": []}
+
+    for n in (1, 2, 1, 3):
+        cache.get(markup(n))
+    assert len(cache._memory) == 2
+    assert (cache.hits, cache.misses) == (1, 3)
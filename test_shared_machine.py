@@ -0,0 +1,41 @@
+import gc
+import weakref
+
+from shared_machine import SharedMachine
+
+
+class Light:
+    __slots__ = ("state", "__weakref__")
+
+
+def make_machine():
+    return SharedMachine(
+        Light,
+        states=["red", "green"],
+        transitions=[{"trigger": "timeup", "source": "red", "dest": "green"}],
+        initial="red",
+    )
+
+
+def test_models_share_the_machine():
+    machine = make_machine()
+    lights = machine.create(3)
+    lights[0].timeup()
+    assert [light.state for light in lights] == ["green", "red", "red"]
+    assert lights[1].is_red()
+
+
+def test_removed_models_are_freed():
+    machine = make_machine()
+    lights = machine.create(1000)
+    kept = lights[::2]
+    refs = [weakref.ref(light) for light in lights[1::2]]
+
+    machine.remove_model(lights[1::2])
+    del lights
+    gc.collect()
+
+    assert len(machine.models) == len(kept)
+    assert all(ref() is None for ref in refs)
+    kept[0].timeup()
+    assert kept[0].state == "green"
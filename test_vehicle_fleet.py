@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from car import Vehicle
+from vehicle_fleet import VehicleFleet
+
+
+def expected_states(lights, states):
+    # What a real Vehicle would do for each (light, state) pair
+    vehicle = Vehicle()
+    result = []
+    for light, state in zip(lights, states):
+        vehicle.machine.set_state(state)
+        vehicle.handle_traffic_light(VehicleFleet.lights[light])
+        result.append(vehicle.state)
+    return result
+
+
+@pytest.mark.parametrize(
+    "make_lights",
+    [
+        lambda lights: lights,  # Plain list
+        lambda lights: np.array(lights),  # Default int64 array
+        lambda lights: np.array(lights, dtype=np.uint8),
+    ],
+)
+def test_per_vehicle_lights(make_lights):
+    lights = [0, 1, 2, 2, 0, 1, 0, 2, 1, 0]
+    fleet = VehicleFleet(len(lights))
+    fleet.handle_traffic_light("green")
+    before = [fleet.state_of(i) for i in range(len(fleet))]
+
+    fleet.handle_traffic_light(make_lights(lights))
+
+    assert [fleet.state_of(i) for i in range(len(fleet))] == expected_states(lights, before)
+
+
+def test_per_vehicle_lights_are_checked():
+    fleet = VehicleFleet(3)
+    with pytest.raises(ValueError):
+        fleet.handle_traffic_light([0, 1])
+    with pytest.raises(ValueError):
+        fleet.handle_traffic_light([0, 1, len(VehicleFleet.lights)])
+    with pytest.raises(ValueError):
+        fleet.handle_traffic_light(np.array([0, -1, 2]))
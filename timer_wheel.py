@@ -0,0 +1,189 @@
+import math
+import time
+import logging
+import threading
+
+
+class Timer:
+    __slots__ = ("expires", "callback", "args", "cancelled")
+
+    def __init__(self, expires, callback, args):
+        self.expires = expires  # Tick number
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        # Cancelled timers stay in their bucket and are dropped when it expires
+        self.cancelled = True
+
+
+class TimerWheel:
+    """
+    Hierarchical timer wheel firing callbacks (e.g. timed triggers) from one thread.
+
+    Time is cut into ticks of `tick` seconds. Level 0 has one bucket per tick
+    for the next 2**bits ticks, every further level covers 2**bits times the
+    range of the previous one with the same number of buckets. Scheduling
+    appends the timer to the bucket of the level its delay falls into, and
+    whenever a level has gone round once, the next bucket of the level above
+    is redistributed to the finer levels. Scheduling, cancelling and expiring
+    are O(1) no matter how many timers are pending; a callback fires at most
+    one tick late (plus however long the callbacks before it in the same tick
+    take).
+
+    Callbacks run on the wheel's thread, so machines driven by timed triggers
+    must not be triggered from other threads at the same time.
+    """
+
+    def __init__(self, tick=0.01, bits=8, levels=4):
+        self.tick = tick
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self.wheels = [[[] for _ in range(1 << bits)] for _ in range(levels)]
+
+        self.current = 0  # Last tick that was processed
+        self.max_lateness = 0.0
+        self.fired = 0
+
+        self._origin = time.monotonic()
+        self._firing = None  # (thread id, tick) while callbacks run
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _now_tick(self):
+        return int((time.monotonic() - self._origin) / self.tick)
+
+    def schedule(self, delay, callback, *args):
+        """
+        Calls callback(*args) `delay` seconds from now; returns a Timer with cancel().
+        """
+        firing = self._firing
+        if firing is not None and firing[0] == threading.get_ident():
+            # Rescheduled from a callback: count from its due time, so a light
+            # switching every 2 s does not drift by the lateness of each switch
+            expires = firing[1] + math.ceil(delay / self.tick)
+        else:
+            expires = math.ceil((time.monotonic() + delay - self._origin) / self.tick)
+        with self._lock:
+            timer = Timer(max(expires, self.current + 1), callback, args)
+            self._insert(timer)
+        return timer
+
+    def _insert(self, timer):
+        delta = timer.expires - self.current
+        for level, wheel in enumerate(self.wheels):
+            if delta < 1 << (self.bits * (level + 1)):
+                wheel[(timer.expires >> (self.bits * level)) & self.mask].append(timer)
+                return
+        raise ValueError(f"Timer {delta * self.tick:.0f} s ahead is beyond the wheel's range")
+
+    def _cascade(self, level):
+        # Move the timers of the level's next bucket down to the finer levels
+        wheel = self.wheels[level]
+        index = (self.current >> (self.bits * level)) & self.mask
+        timers, wheel[index] = wheel[index], []
+        for timer in timers:
+            if not timer.cancelled:
+                self._insert(timer)
+        return index
+
+    def advance(self, until=None):
+        """
+        Processes every tick up to `until` (default: now) and fires the due timers.
+        """
+        until = self._now_tick() if until is None else until
+        while self.current < until:
+            with self._lock:
+                self.current += 1
+                if self.current & self.mask == 0:
+                    # Level 0 went round: refill it from level 1, and further up
+                    # for every level that went round as well
+                    level = 1
+                    while level < len(self.wheels) and self._cascade(level) == 0:
+                        level += 1
+                bucket = self.wheels[0][self.current & self.mask]
+                self.wheels[0][self.current & self.mask] = []
+
+            self._firing = (threading.get_ident(), self.current)
+            for timer in bucket:
+                if timer.cancelled:
+                    continue
+                lateness = time.monotonic() - (self._origin + timer.expires * self.tick)
+                self.max_lateness = max(self.max_lateness, lateness)
+                self.fired += 1
+                try:
+                    timer.callback(*timer.args)
+                except Exception:
+                    logging.exception(f"Timer callback {timer.callback!r} failed")
+            self._firing = None
+
+    def timed_trigger(self, model, state, after, trigger, machine=None):
+        """
+        Fires `trigger` on `model` `after` seconds after it enters `state`,
+        unless it has left the state by then, e.g. timeup 2 s after green.
+        """
+        machine = model.machine if machine is None else machine
+        pending = []
+
+        def fire():
+            pending.clear()
+            model.trigger(trigger)
+
+        def arm(*args, **kwargs):
+            pending.append(self.schedule(after, fire))
+
+        def disarm(*args, **kwargs):
+            while pending:
+                pending.pop().cancel()
+
+        machine.get_state(state).add_callback("enter", arm)
+        machine.get_state(state).add_callback("exit", disarm)
+        if model.state == state:
+            arm()
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Sleep until the start of the next tick
+            next_tick = self._origin + (self.current + 1) * self.tick
+            delay = next_tick - time.monotonic()
+            if delay > 0 and self._stop.wait(delay):
+                break
+            self.advance()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="TimerWheel", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+if __name__ == "__main__":
+    from traffic_light import TrafficLight
+
+    # Setup logging
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("transitions").setLevel(logging.WARNING)
+
+    # Thousands of traffic lights, each switching every 2 s, served by one thread
+    wheel = TimerWheel()
+    lights = [TrafficLight() for _ in range(5000)]
+    for light in lights:
+        for state in TrafficLight.states:
+            wheel.timed_trigger(light, state, 2.0, "timeup")
+
+    wheel.start()
+    try:
+        time.sleep(10)
+    finally:
+        wheel.stop()
+
+    logging.info(
+        f"{wheel.fired} timed triggers fired, at most {wheel.max_lateness * 1000:.1f} ms late"
+    )
@@ -1,6 +1,9 @@
 import time
 from transitions import Machine
-from multiprocessing import shared_memory
+
+from shm_state import SharedStateSlot
+from event_ring import EventRing
+from timer_wheel import TimerWheel
 
 
 class TrafficLight(object):
@@ -19,35 +22,37 @@ class TrafficLight(object):
 if __name__ == "__main__":
     traffic_light = TrafficLight()
 
-    max_state_length = max(len(state) for state in TrafficLight.states)
-    data_size = max_state_length
-
-    # Create shared memory with a custom name and size sufficient for the states
-    shm = shared_memory.SharedMemory(name="my_custom_shm", create=True, size=data_size)
-
-    try:
-        while True:
-            time.sleep(2)
+    # Publish the state as a typed seqlock slot under a well-known name
+    shm = SharedStateSlot("my_custom_shm", states=TrafficLight.states, create=True)
+    shm.attach(traffic_light.machine, traffic_light)
 
-            # Trigger state transition
-            traffic_light.timeup()
+    # Keep every transition as well, for consumers that must not miss any
+    events = EventRing("my_custom_events", create=True)
+    events.attach(traffic_light.machine)
 
-            # Get the new state and encode it as bytes
-            data = traffic_light.state
-            data_bytes = data.encode("utf-8")
+    # Switch every 2 s from the timer wheel's thread instead of a sleep loop
+    wheel = TimerWheel()
+    for state in TrafficLight.states:
+        wheel.timed_trigger(traffic_light, state, 2.0, "timeup")
 
-            # Zero out the buffer to prevent leftover data from previous writes
-            shm.buf[:data_size] = b"\x00" * data_size
+    # For debugging, print the current state after every transition
+    def print_state(*args, **kwargs):
+        print(f"Current state: {traffic_light.state}")
 
-            # Write the new data to shared memory (only as many bytes as needed)
-            shm.buf[: len(data_bytes)] = data_bytes
+    traffic_light.machine.after_state_change.append(print_state)
 
-            # For debugging, print the current state
-            print(f"Current state: {data}")
+    try:
+        wheel.start()
+        while True:
+            time.sleep(1)
 
     except KeyboardInterrupt:
         pass
     finally:
+        wheel.stop()
+
         # Clean up shared memory when done
         shm.close()
         shm.unlink()
+        events.close()
+        events.unlink()
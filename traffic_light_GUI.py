@@ -1,8 +1,9 @@
 import time
 import logging
 
-from transitions_gui import WebMachine
-from multiprocessing import shared_memory
+from utils import make_machine, stop_gui
+from shm_state import SharedStateSlot
+from timer_wheel import TimerWheel
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -11,9 +12,9 @@ logging.basicConfig(level=logging.INFO)
 class TrafficLightStateMachine:
     states = ["green", "yellow", "red"]
 
-    def __init__(self):
+    def __init__(self, gui=None):
         # Initialize the state machine
-        self.machine = WebMachine(
+        self.machine = make_machine(
             model=self,
             states=TrafficLightStateMachine.states,
             initial="red",
@@ -21,6 +22,7 @@ class TrafficLightStateMachine:
             ignore_invalid_triggers=True,
             auto_transitions=False,
             port=8083,
+            gui=gui,
         )
 
         self.machine.add_transition(trigger="timeup", source="green", dest="yellow")
@@ -32,35 +34,33 @@ if __name__ == "__main__":
     # Create the traffic light state machine
     traffic_light = TrafficLightStateMachine()
 
-    max_state_length = max(len(state) for state in traffic_light.states)
-    data_size = max_state_length
+    # Publish the state as a typed seqlock slot under a well-known name
+    shm = SharedStateSlot(
+        "my_custom_shm", states=TrafficLightStateMachine.states, create=True
+    )
+    shm.attach(traffic_light.machine, traffic_light)
 
-    # Create shared memory with a custom name and size sufficient for the states
-    shm = shared_memory.SharedMemory(name="my_custom_shm", create=True, size=data_size)
+    # Change states every 2 s from the timer wheel's thread
+    wheel = TimerWheel()
+    for state in TrafficLightStateMachine.states:
+        wheel.timed_trigger(traffic_light, state, 2.0, "timeup")
 
-    # Main loop to change states
-    try:
-        while True:
-            time.sleep(2)
-
-            traffic_light.timeup()
-
-            # Get the new state and encode it as bytes
-            data = traffic_light.state
-            data_bytes = data.encode("utf-8")
+    def log_state(*args, **kwargs):
+        logging.info(f"Traffic light state: {traffic_light.state}")
 
-            # Zero out the buffer to prevent leftover data from previous writes
-            shm.buf[:data_size] = b"\x00" * data_size
+    traffic_light.machine.after_state_change.append(log_state)
 
-            # Write the new data to shared memory (only as many bytes as needed)
-            shm.buf[: len(data_bytes)] = data_bytes
-
-            logging.info(f"Traffic light state: {traffic_light.state}")
+    try:
+        wheel.start()
+        while True:
+            time.sleep(1)
 
     except KeyboardInterrupt:  # Ctrl + C to stop the server
-        traffic_light.machine.stop_server()
+        stop_gui(traffic_light.machine)
 
     finally:
+        wheel.stop()
+
         # Clean up shared memory when done
         shm.close()
         shm.unlink()
@@ -1,8 +1,9 @@
 import time
 import logging
+from multiprocessing import Process, Lock
 
-from transitions_gui import WebMachine  # noqa
-from multiprocessing import Process, Manager
+from utils import make_machine
+from shm_state import SharedStateSlot
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -14,7 +15,7 @@ class TrafficLightStateMachine:
     def __init__(self, shared_state):
         # Initialize the state machine with shared state
         self.shared_state = shared_state
-        self.machine = WebMachine(
+        self.machine = make_machine(
             model=self,
             states=TrafficLightStateMachine.states,
             initial="red",
@@ -49,7 +50,7 @@ class VehicleStateMachine:
 
     def __init__(self):
         # Initialize the state machine
-        self.machine = WebMachine(
+        self.machine = make_machine(
             model=self,
             states=VehicleStateMachine.states,
             initial="stop",
@@ -106,10 +107,14 @@ def run_car(shared_state):
 
 
 if __name__ == "__main__":
-    with Manager() as manager:
-        shared_state = manager.Value("s", "red")
-        # traffic_light = TrafficLightStateMachine(shared_state)
-
+    # Share the traffic light state through shared memory instead of a Manager proxy
+    shared_state = SharedStateSlot(
+        states=TrafficLightStateMachine.states, create=True, lock=Lock()
+    )
+    shared_state.value = "red"
+    # traffic_light = TrafficLightStateMachine(shared_state)
+
+    try:
         # Start processes for traffic light and vehicle logic
         p1 = Process(target=run_light, args=(shared_state,))
         p2 = Process(target=run_car, args=(shared_state,))
@@ -120,3 +125,8 @@ if __name__ == "__main__":
         # Wait for processes to complete
         p1.join()
         p2.join()
+
+    finally:
+        # Clean up shared memory when done
+        shared_state.close()
+        shared_state.unlink()
@@ -0,0 +1,299 @@
+import os
+import sys
+import mmap
+import time
+import zlib
+import struct
+import logging
+import threading
+from collections import namedtuple
+
+MAGIC = b"SMJR"
+VERSION = 1
+
+# magic, version | records
+HEADER = struct.Struct("<4sH10x")
+
+# Sequence number, timestamp, kind, flags, trigger (or command), source,
+# dest, then a CRC32 of all of it, so a record torn by a crash is recognised
+NAME_SIZE = 64
+BODY = struct.Struct(f"<QdBB6x{NAME_SIZE}s{NAME_SIZE}s{NAME_SIZE}s")
+CRC = struct.Struct("<I4x")
+RECORD_SIZE = BODY.size + CRC.size
+
+# Record kinds
+TRANSITION = 0
+COMMAND = 1  # Command sent to the hardware, its transition has not happened yet
+HOMED = 2
+
+# Flags, carried forward from record to record so the last one tells all
+FLAG_HOMED = 1  # The hardware was homed and not sent to home again since
+
+JournalRecord = namedtuple(
+    "JournalRecord", ["seq", "timestamp", "kind", "flags", "trigger", "source", "dest"]
+)
+
+Recovery = namedtuple("Recovery", ["state", "safe", "reason", "record"])
+
+
+def _encode(name):
+    encoded = name.encode("utf-8")
+    if len(encoded) > NAME_SIZE:
+        raise ValueError(f"{name!r} is longer than {NAME_SIZE} bytes")
+    return encoded
+
+
+def _decode(name):
+    return name.rstrip(b"\0").decode("utf-8")
+
+
+def _unpack(buf, offset):
+    # The record at `offset`, or None if it is torn or corrupt
+    body = buf[offset : offset + BODY.size]
+    (crc,) = CRC.unpack_from(buf, offset + BODY.size)
+    if zlib.crc32(body) != crc:
+        return None
+    seq, timestamp, kind, flags, trigger, source, dest = BODY.unpack(body)
+    return JournalRecord(
+        seq, timestamp, kind, flags, _decode(trigger), _decode(source), _decode(dest)
+    )
+
+
+def journal_path(name):
+    """
+    Path of the journal of the machine called `name`, or None without journaling.
+
+    STATE_MACHINES_JOURNAL names a directory shared by all machines; each
+    one gets its own `<name>.journal` in it, since two processes appending
+    to one journal would recover each other's states.
+    """
+    directory = os.environ.get("STATE_MACHINES_JOURNAL")
+    if not directory:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{name}.journal")
+
+
+class TransitionJournal:
+    """
+    Append-only file of every transition of one machine, for crash recovery.
+
+    Records are fixed size and carry a CRC, so the last one is found without
+    reading the rest of the file, and a record half written when the process
+    died is recognised and cut off the next time the journal is opened.
+    Appending is a single write() to the kernel, which survives the process
+    dying; fsync(), needed to also survive a power loss, is batched to once
+    every `sync_every` records or `sync_interval` seconds, whichever comes
+    first. Reads go through mmap.
+
+    Besides transitions the journal records COMMAND records when a command
+    that moves hardware (e.g. the table's "5") is sent, and HOMED once the
+    hardware has been homed. recover() uses them to tell whether the machine
+    was between a command and its transition when it died, in which case the
+    hardware's position is unknown and it has to be homed again. Both are
+    fsynced right away: a COMMAND lost to a power loss would make recover()
+    trust a position the hardware has already left.
+
+    With readonly=True the journal is only inspected: a missing file raises
+    FileNotFoundError instead of being created, and a torn tail is skipped
+    instead of cut off, so a journal in use by a running machine is safe.
+    """
+
+    def __init__(self, path, sync_every=32, sync_interval=1.0, readonly=False):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.readonly = readonly
+        self._lock = threading.Lock()
+
+        # O_BINARY keeps Windows from translating newlines in the records
+        if readonly:
+            flags = os.O_RDONLY
+        else:
+            flags = os.O_RDWR | os.O_CREAT | os.O_APPEND
+        self._fd = os.open(path, flags | getattr(os, "O_BINARY", 0), 0o644)
+        size = os.fstat(self._fd).st_size
+        if size < HEADER.size and not readonly:
+            # New, or the process died while writing the header: start over
+            if size > 0:
+                logging.warning(f"{path}: rewriting a torn header")
+                os.ftruncate(self._fd, 0)
+            os.write(self._fd, HEADER.pack(MAGIC, VERSION))
+            os.fsync(self._fd)
+        elif size > 0:
+            with open(path, "rb") as f:
+                header = f.read(HEADER.size)
+            if len(header) < HEADER.size or HEADER.unpack(header) != (MAGIC, VERSION):
+                os.close(self._fd)
+                raise ValueError(f"{path} is not a version {VERSION} transition journal")
+
+        # Drop a torn tail, new records must start on a record boundary
+        index, last = self._last()
+        valid = HEADER.size + (index + 1) * RECORD_SIZE
+        size = os.fstat(self._fd).st_size
+        if size > valid and not readonly:
+            logging.warning(f"{path}: dropping {size - valid} bytes of torn records")
+            os.ftruncate(self._fd, valid)
+            os.fsync(self._fd)
+
+        self._seq = 0 if last is None else last.seq + 1
+        self._flags = 0 if last is None else last.flags
+        self._source = None  # Source state of a CompiledMachine transition in progress
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def records(self, start=0):
+        """
+        Every intact record from `start` (a record index) on, read through mmap.
+        """
+        size = os.fstat(self._fd).st_size
+        if size <= HEADER.size:
+            return
+        with mmap.mmap(self._fd, size, access=mmap.ACCESS_READ) as buf:
+            for index in range(start, (size - HEADER.size) // RECORD_SIZE):
+                record = _unpack(buf, HEADER.size + index * RECORD_SIZE)
+                if record is None:
+                    return  # Torn tail
+                yield record
+
+    def _last(self):
+        # Index and record of the newest intact record, walking back from the end
+        size = os.fstat(self._fd).st_size
+        if size < HEADER.size + RECORD_SIZE:
+            return -1, None
+        with mmap.mmap(self._fd, size, access=mmap.ACCESS_READ) as buf:
+            for index in range((size - HEADER.size) // RECORD_SIZE - 1, -1, -1):
+                record = _unpack(buf, HEADER.size + index * RECORD_SIZE)
+                if record is not None:
+                    return index, record
+        return -1, None
+
+    def last_record(self):
+        """
+        The newest intact record, or None; only looks at the end of the file.
+        """
+        return self._last()[1]
+
+    def append(self, kind, trigger, source, dest, timestamp=None):
+        if self.readonly:
+            raise ValueError(f"{self.path} is open read-only")
+        names = (_encode(trigger), _encode(source), _encode(dest))
+        with self._lock:
+            body = BODY.pack(
+                self._seq,
+                time.time() if timestamp is None else timestamp,
+                kind,
+                self._flags,
+                *names,
+            )
+            os.write(self._fd, body + CRC.pack(zlib.crc32(body)))
+            self._seq += 1
+
+            self._unsynced += 1
+            now = time.monotonic()
+            if self._unsynced >= self.sync_every or now - self._last_sync >= self.sync_interval:
+                self._sync(now)
+
+    def _sync(self, now=None):
+        os.fsync(self._fd)
+        self._unsynced = 0
+        self._last_sync = time.monotonic() if now is None else now
+
+    def command(self, cmd, state, homing=False):
+        if homing:
+            # Until homed() the position is unknown, even after transitions
+            self._flags &= ~FLAG_HOMED
+        self.append(COMMAND, cmd, state, state)
+        with self._lock:
+            self._sync()  # Durable before the hardware is told to move
+
+    def homed(self, state):
+        self._flags |= FLAG_HOMED
+        self.append(HOMED, "", state, state)
+        with self._lock:
+            self._sync()  # Skipping the next homing relies on this record
+
+    def attach(self, machine):
+        """
+        Appends a TRANSITION record for every transition `machine` performs.
+
+        Like EventRing.attach, from an `after` callback added to each
+        transition; CompiledMachine gets them through add_transition_callback.
+        """
+        if hasattr(machine, "events"):
+            for event in machine.events.values():
+                for transitions in event.transitions.values():
+                    for transition in transitions:
+                        # Internal transitions (dest None) stay in their source state
+                        dest = transition.source if transition.dest is None else transition.dest
+                        transition.add_callback(
+                            "after", self._recorder(event.name, transition.source, dest)
+                        )
+        else:
+            # Compiled callbacks are per trigger: note the source before the
+            # state changes, the destination is the state afterwards
+            def note_source(*args, **kwargs):
+                self._source = machine.model.state
+
+            for trigger in machine.triggers:
+                machine.add_transition_callback(trigger, "before", note_source)
+                machine.add_transition_callback(trigger, "after", self._compiled_recorder(machine, trigger))
+
+    def _recorder(self, trigger, source, dest):
+        def record(*args, **kwargs):
+            self.append(TRANSITION, trigger, source, dest)
+
+        return record
+
+    def _compiled_recorder(self, machine, trigger):
+        def record(*args, **kwargs):
+            self.append(TRANSITION, trigger, self._source, machine.model.state)
+
+        return record
+
+    def recover(self, states, max_age=None):
+        """
+        The state to resume in, from the newest intact record.
+
+        `safe` says whether the hardware may be trusted to still be where the
+        journal left it: the hardware was homed (and not sent homing again
+        without finishing), no command was in flight when the journal ended
+        and, with `max_age` (seconds), the last record is recent enough.
+        Without a usable record the state is None. Only reads the last record.
+        """
+        record = self.last_record()
+        if record is None:
+            return Recovery(None, False, "empty journal", None)
+        if record.dest not in states:
+            return Recovery(None, False, f"unknown state {record.dest!r}", record)
+        if record.kind == COMMAND:
+            return Recovery(record.dest, False, f"command {record.trigger!r} was in flight", record)
+        if max_age is not None and time.time() - record.timestamp > max_age:
+            return Recovery(record.dest, False, "journal is too old", record)
+        if not record.flags & FLAG_HOMED:
+            return Recovery(record.dest, False, "not homed", record)
+        return Recovery(record.dest, True, "consistent", record)
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                if not self.readonly:
+                    self._sync()
+                os.close(self._fd)
+                self._fd = None
+
+
+if __name__ == "__main__":
+    # Print a journal and what a restart would recover from it
+    journal = TransitionJournal(sys.argv[1], readonly=True)
+    kinds = {TRANSITION: "transition", COMMAND: "command", HOMED: "homed"}
+    for record in journal.records():
+        print(
+            f"{record.seq:8d} {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.timestamp))} "
+            f"{kinds.get(record.kind, record.kind):10s} {record.trigger:40s} "
+            f"{record.source} -> {record.dest}"
+        )
+    last = journal.last_record()
+    recovery = journal.recover([last.dest] if last else [])
+    print(f"Recovers {recovery.state} ({recovery.reason})")
+    journal.close()
@@ -1,12 +1,145 @@
+import os
 import time
+import logging
+import threading
 
+from serial_stats import link_stats
+
+
+def make_machine(port=8080, gui=None, **kwargs):
+    """
+    Builds a machine with or without a GUI, taking the same arguments as WebMachine.
+
+    `gui` (default: the STATE_MACHINES_GUI environment variable, else "web")
+    picks the front end. "off" builds a plain transitions.Machine: no web
+    server and transitions_gui/tornado are never imported, which is what
+    production workers and tests want. With "web" every machine starts its
+    own WebMachine server on `port`; with "shared" it registers with the shared gui_server instead
+    (at STATE_MACHINES_GUI_ADDRESS, host:port, if set), so any number of
+    machines in any number of processes are served on one port.
+
+    GUI updates are coalesced and pushed STATE_MACHINES_GUI_RATE times per
+    second (default gui_push.DEFAULT_RATE) from a background thread, so fast
+    transitions do not wait for the web layer; a rate of 0 pushes every
+    transition synchronously like a plain WebMachine.
+    """
+    gui = gui or os.environ.get("STATE_MACHINES_GUI", "web")
+    if gui == "off":
+        from transitions import Machine
+
+        return Machine(**kwargs)
+
+    if gui == "shared":
+        from gui_server import ADDRESS, SharedWebMachine, connect
+
+        address = ADDRESS
+        if os.environ.get("STATE_MACHINES_GUI_ADDRESS"):
+            host, _, channel_port = os.environ["STATE_MACHINES_GUI_ADDRESS"].rpartition(":")
+            address = (host or "localhost", int(channel_port))
+        machine = SharedWebMachine(gui_client=connect(address), **kwargs)
+    else:
+        from transitions_gui import WebMachine
+
+        machine = WebMachine(port=port, **kwargs)
+
+    from gui_push import DEFAULT_RATE, coalesce, default_pusher
+
+    rate = float(os.environ.get("STATE_MACHINES_GUI_RATE", DEFAULT_RATE))
+    if rate > 0:
+        coalesce(machine, default_pusher(rate))
+    return machine
+
+
+def stop_gui(machine):
+    # Headless machines have no server to stop
+    stop_server = getattr(machine, "stop_server", None)
+    if stop_server is not None:
+        stop_server()
+
+
+def write_read(ser, x, timeout=None, stats=None):
+    # Every command is accounted in the port's SerialStats unless given other stats
+    if stats is None:
+        stats = link_stats(getattr(ser, "port", None), getattr(ser, "baudrate", 9600))
 
-def write_read(ser, x):
     # Send data to Arduino
-    ser.write(bytes(x, "utf-8"))  # Send with newline
+    out = bytes(x, "utf-8")
+    started = time.perf_counter_ns()
+    ser.write(out)  # Send with newline
 
-    # Wait for a response
-    while True:
-        data = ser.readline().decode("utf-8").strip()
+    # Wait for a response, giving up after `timeout` seconds (None waits forever)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    empty_reads = 0
+    received = 0
+    while deadline is None or time.monotonic() < deadline:
+        line = ser.readline()
+        received += len(line)
+        data = line.decode("utf-8").strip()
         if data:  # Check if data is received
+            stats.record(x, time.perf_counter_ns() - started, len(out), received, empty_reads)
             return data
+        empty_reads += 1
+
+    stats.record_timeout(x, len(out), received, empty_reads)
+    return None
+
+
+def run_actions(
+    model, cycle_state=None, min_dwell=0.0, max_cycles=None, retry_delay=1.0, stop=None
+):
+    """
+    Drives `model.state_action_map` as fast as the actions complete.
+
+    Every state change sets an event from the machine's after_state_change
+    hook, so the next action fires as soon as the previous one has finished.
+    An action that does not change the state (e.g. no reply from the Arduino)
+    is retried after `retry_delay` seconds. `min_dwell` is the minimum time
+    spent in each state, either one value or a dict per state. Each return to
+    `cycle_state` closes a cycle; the run stops after `max_cycles` cycles or
+    once the `stop` event is set, and returns the achieved cycle times.
+    """
+    stop = stop or threading.Event()
+    state_changed = threading.Event()
+
+    def signal_done(*args, **kwargs):
+        state_changed.set()
+
+    model.machine.after_state_change.append(signal_done)
+
+    cycle_times = []
+    cycle_start = None
+    entered = time.monotonic()
+
+    try:
+        while not stop.is_set() and (max_cycles is None or len(cycle_times) < max_cycles):
+            state = model.state
+            logging.info(f"Current state: {state}")
+
+            # Stay in the state for at least its dwell time
+            dwell = min_dwell.get(state, 0.0) if isinstance(min_dwell, dict) else min_dwell
+            remaining = entered + dwell - time.monotonic()
+            if remaining > 0 and stop.wait(remaining):
+                break
+
+            action = model.state_action_map.get(state)
+            state_changed.clear()
+
+            if action:
+                action()  # Call the action associated with the current state
+            else:
+                logging.error(f"No action defined for state: {state}")
+
+            # Returns at once when the action has already completed the transition
+            if not state_changed.wait(timeout=retry_delay):
+                continue
+
+            entered = time.monotonic()
+            if model.state == cycle_state:
+                if cycle_start is not None:
+                    cycle_times.append(entered - cycle_start)
+                    logging.info(f"Cycle time: {cycle_times[-1]:.3f} s")
+                cycle_start = entered
+    finally:
+        model.machine.after_state_change.remove(signal_done)
+
+    return cycle_times
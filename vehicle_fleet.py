@@ -0,0 +1,112 @@
+import time
+
+import numpy as np
+
+from car import Vehicle
+
+
+def build_fleet_table(lights):
+    """
+    Returns a (light, vehicle state) -> vehicle state table by running a real
+    Vehicle through handle_traffic_light() once per combination, so the fleet
+    follows exactly the same rules as a single car.
+    """
+    table = np.empty((len(lights), len(Vehicle.states)), dtype=np.uint8)
+    vehicle = Vehicle()
+    for i, light in enumerate(lights):
+        for j, state in enumerate(Vehicle.states):
+            vehicle.machine.set_state(state)
+            vehicle.handle_traffic_light(light)
+            table[i, j] = Vehicle.states.index(vehicle.state)
+    return table
+
+
+class VehicleFleet:
+    """
+    Many Vehicles without one Machine each.
+
+    The states of all vehicles live in one uint8 array (indices into
+    Vehicle.states) and a traffic light change is applied to the whole fleet
+    with one lookup in a precomputed transition table, instead of a
+    handle_traffic_light() call per car. Rows of the table that send every
+    vehicle to the same state (red, green) become a fill and rows that change
+    nothing (yellow) are skipped, which is what keeps 100k vehicles in the
+    microseconds; other rows fall back to a gather.
+    """
+
+    lights = ["green", "yellow", "red"]
+
+    def __init__(self, size, initial="stop"):
+        self.table = build_fleet_table(self.lights)
+        self.light_index = {light: i for i, light in enumerate(self.lights)}
+        self.states = np.full(size, Vehicle.states.index(initial), dtype=np.uint8)
+
+        # Cheapest way to apply each light: (fill value, gather row), both None for no-op
+        identity = np.arange(len(Vehicle.states), dtype=np.uint8)
+        self._plans = []
+        for row in self.table:
+            if (row == row[0]).all():
+                self._plans.append((int(row[0]), None))
+            elif (row == identity).all():
+                self._plans.append((None, None))
+            else:
+                self._plans.append((None, row))
+
+        # Flat table for per-vehicle lights, indexed by light * n_states + state
+        self._flat_table = self.table.ravel()
+        self._scratch = np.empty(size, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.states)
+
+    def handle_traffic_light(self, traffic_light_state):
+        """
+        Applies one light state to every vehicle, in place.
+
+        `traffic_light_state` is a light name for the whole fleet, or an array
+        (or list) with one index into `lights` per vehicle (e.g. cars at
+        different crossings); a wrong length or index raises ValueError.
+        """
+        if isinstance(traffic_light_state, str):
+            index = self.light_index.get(traffic_light_state)
+            if index is None:
+                return  # No action for this state
+            fill, row = self._plans[index]
+            if fill is not None:
+                self.states.fill(fill)
+            elif row is not None:
+                np.take(row, self.states, out=self.states)
+        else:
+            lights = np.asarray(traffic_light_state)
+            if lights.shape != self.states.shape:
+                raise ValueError(
+                    f"Expected {len(self.states)} light indices, got shape {lights.shape}"
+                )
+            if lights.size and (lights.min() < 0 or lights.max() >= len(self.lights)):
+                raise ValueError(f"Light indices must be in 0..{len(self.lights) - 1}")
+
+            # Any integer array or list will do, the lookup itself runs in uint8
+            scratch = self._scratch
+            np.multiply(lights.astype(np.uint8, copy=False), len(Vehicle.states), out=scratch)
+            np.add(scratch, self.states, out=scratch)
+            np.take(self._flat_table, scratch, out=self.states)
+
+    def count(self, state):
+        return int(np.count_nonzero(self.states == Vehicle.states.index(state)))
+
+    def state_of(self, vehicle):
+        return Vehicle.states[self.states[vehicle]]
+
+
+if __name__ == "__main__":
+    fleet = VehicleFleet(100_000)
+
+    # Run the light's cycle a few times and time the fleet updates
+    cycle = ["red", "yellow", "green"] * 1000
+    started = time.perf_counter()
+    for light in cycle:
+        fleet.handle_traffic_light(light)
+    elapsed = time.perf_counter() - started
+
+    print(f"{len(fleet)} vehicles, {elapsed / len(cycle) * 1e6:.1f} us per light change")
+    print(f"Moving: {fleet.count('moving')}, stopped: {fleet.count('stop')}")